@@ -0,0 +1,219 @@
+import os
+import copy
+import json
+import numpy as np
+
+import settings
+
+SCHEMA_VERSION = 1
+FAMILIES = ['m-resnet', 'm-resnet_optimized', 'm-resnet_student', 'b-resnet', 'b-cos']
+
+METADATA_FILE = "metadata.json"
+KERAS_GRAPH_DIR = "saved_model"
+KERAS_WEIGHTS_FILE = "model.weights.h5"
+TORCH_GRAPH_FILE = "model.torchscript.pt"
+TORCH_WEIGHTS_FILE = "state_dict.pt"
+
+
+def _settings_metadata():
+    return {
+        'maxlen': settings.maxlen,
+        'valid_chars': settings.valid_chars,
+        'tlds': settings.tlds,
+        'group_map': {str(k): v for k, v in settings.group_map.items()},
+    }
+
+
+def _metadata(model, family):
+    metadata = dict(_settings_metadata(), family=family, schema_version=SCHEMA_VERSION)
+    if family == 'm-resnet_optimized':
+        metadata['sparse_tld'] = model.inputs[1].shape[1] == 1
+    if family in ('m-resnet', 'm-resnet_student') and model.inputs[0].shape[1] is None:
+        metadata['length_buckets'] = list(settings.length_buckets)
+    return metadata
+
+
+class Artifact:
+
+    def __init__(self, family, predict_fn, metadata):
+        """
+        A model ready for inference. predict maps the encoded domains (and TLD input of the optimized M-ResNet)
+        to the model output as numpy array: probabilities for the Keras models, logits for B-cos.
+        """
+        assert family in FAMILIES, f"family needs to be one of {FAMILIES}"
+        self.family = family
+        self.predict_fn = predict_fn
+        self.metadata = metadata
+
+    @property
+    def sparse_tld(self):
+        return self.metadata.get('sparse_tld', False)
+
+    @property
+    def split(self):
+        """
+        Parameters of the k-fold split the model was trained on (see split_parameters), None if not recorded.
+        """
+        return self.metadata.get('split')
+
+    @property
+    def length_buckets(self):
+        """
+        Bucket widths of a variable-length M-ResNet (see util.predict_bucketed), None for fixed-length models.
+        """
+        return self.metadata.get('length_buckets')
+
+    def predict(self, x):
+        return self.predict_fn(x)
+
+
+def from_model(model, family):
+    """
+    Wraps a model living in this process (e.g. right after training) into an Artifact.
+    """
+    metadata = _metadata(model, family)
+
+    if family == 'b-cos':
+        import torch
+
+        def predict(x):
+            with torch.no_grad():
+                return model(torch.as_tensor(x).long()).numpy()
+    else:
+        def predict(x):
+            # Keras traces the predict function per input shape, padding to powers of two bounds the number of traces.
+            x = x if isinstance(x, list) else [x]
+            n = len(x[0])
+            size = 1 << (n - 1).bit_length()
+            x = [np.concatenate([a, np.zeros((size - n,) + a.shape[1:], dtype=a.dtype)]) for a in x]
+            return np.asarray(model.predict_on_batch(x if len(x) > 1 else x[0]))[:n]
+
+    return Artifact(family, predict, metadata)
+
+
+def split_parameters(fold, n_splits=4, binary=False, random_state=settings.split_random_state):
+    """
+    Parameters of dataset.DomainDataset.split and the fold a model is trained on, as recorded by save.
+    """
+    return {'n_splits': n_splits, 'binary': binary, 'random_state': random_state, 'fold': fold}
+
+
+def split_indices(data, split):
+    """
+    Returns: The (train, test) row indices of data for split parameters of split_parameters, e.g. to evaluate an
+    artifact on the rows it has not been trained on.
+    """
+    train_test = data.split(n_splits=split['n_splits'], binary=split['binary'], random_state=split['random_state'])
+    return list(train_test)[split['fold']]
+
+
+def save(model, path, family, split=None):
+    """
+    Saves a trained model of one of the FAMILIES to the directory path. Besides the weights,
+    the serialized inference graph (TF SavedModel / TorchScript) is stored so that loading does not need to
+    rebuild the model in Python, together with the settings vocabulary, TLD and class maps and a schema version.
+    Args:
+        model: The trained model.
+        path: Output directory.
+        family: One of FAMILIES.
+        split: Parameters of the split and fold the model was trained on (see split_parameters), recorded so that
+            its held-out rows can be recovered with split_indices.
+    """
+    assert family in FAMILIES, f"family needs to be one of {FAMILIES}"
+    os.makedirs(path, exist_ok=True)
+
+    metadata = _metadata(model, family)
+    if split is not None:
+        metadata['split'] = dict(split)
+
+    if family == 'b-cos':
+        import torch
+        from bcos.export import export_torchscript
+
+        # The caller's model keeps its device and training mode.
+        model = copy.deepcopy(model).cpu().eval()
+        torch.save(model.state_dict(), os.path.join(path, TORCH_WEIGHTS_FILE))
+        export_torchscript(model, os.path.join(path, TORCH_GRAPH_FILE))
+    else:
+        model.save_weights(os.path.join(path, KERAS_WEIGHTS_FILE))
+        model.export(os.path.join(path, KERAS_GRAPH_DIR), verbose=False)
+
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=4)
+
+
+def load_metadata(path):
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+
+    if metadata.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported artifact schema version {metadata.get('schema_version')} in {path}, "
+                         f"expected {SCHEMA_VERSION}")
+
+    current = _settings_metadata()
+    for key in ('maxlen', 'valid_chars', 'tlds'):
+        if metadata[key] != current[key]:
+            raise ValueError(f"Artifact {path} was trained with a different settings.{key}")
+
+    return metadata
+
+
+def load(path, num_threads=None):
+    """
+    Loads an artifact written by save() for inference, without rebuilding the model in Python.
+
+    Args:
+        path: Directory of the artifact.
+        num_threads: Number of intra-op threads of the torch runtime (B-cos only), torch default if None.
+    """
+    metadata = load_metadata(path)
+    family = metadata['family']
+
+    if family == 'b-cos':
+        from bcos.export import Runner
+
+        predict = Runner(os.path.join(path, TORCH_GRAPH_FILE), num_threads)
+    else:
+        import tensorflow as tf
+
+        graph = tf.saved_model.load(os.path.join(path, KERAS_GRAPH_DIR))
+
+        def predict(x):
+            if family == 'm-resnet_optimized':
+                x = [np.asarray(x[0], dtype=np.float32),
+                     np.asarray(x[1], dtype=np.int32 if metadata.get('sparse_tld') else np.float32)]
+            else:
+                x = np.asarray(x, dtype=np.float32)
+            return graph.serve(x).numpy()
+
+    return Artifact(family, predict, metadata)
+
+
+def load_model(path):
+    """
+    Rebuilds the trainable model of an artifact from Python and restores its weights, e.g. to resume training.
+    """
+    metadata = load_metadata(path)
+    family = metadata['family']
+
+    if family == 'b-cos':
+        import torch
+        from bcos.resnet1d_bcos import ResNet
+
+        model = ResNet()
+        model.load_state_dict(torch.load(os.path.join(path, TORCH_WEIGHTS_FILE), map_location='cpu'))
+        return model
+
+    from models import resnet_binary, resnet_multiclass, resnet_multiclass_optimized, resnet_multiclass_student
+    if family == 'b-resnet':
+        model, _ = resnet_binary.build_model()
+        model.build((None, metadata['maxlen']))
+    elif family == 'm-resnet':
+        model, _ = resnet_multiclass.build_model(variable_length='length_buckets' in metadata)
+    elif family == 'm-resnet_student':
+        model, _ = resnet_multiclass_student.build_model(variable_length='length_buckets' in metadata)
+    else:
+        model, _ = resnet_multiclass_optimized.build_model(sparse_tld=metadata.get('sparse_tld', False))
+
+    model.load_weights(os.path.join(path, KERAS_WEIGHTS_FILE))
+    return model
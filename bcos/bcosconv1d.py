@@ -1,3 +1,5 @@
+import copy
+import torch
 import torch.nn.functional as F
 from torch import nn
 import numpy as np
@@ -8,14 +10,121 @@ class NormedConv1d(nn.Conv1d):
     Standard 1D convolution, but with unit norm weights.
     """
 
-    def forward(self, in_tensor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frozen = False
+        self._cache = None
+        self._cache_key = None
+
+    def freeze(self, frozen=True):
+        """
+        In frozen mode the normalised weights are computed once and cached while the module is in eval mode.
+        The cache is recomputed when the weights are modified (optimizer step, load_state_dict, moving the module)
+        and bypassed in training mode. Frozen weights are constants, no gradient flows back into them.
+        """
+        self.frozen = frozen
+        self._cache = self._cache_key = None
+
+    def _normalize(self):
         shape = self.weight.shape
         w = self.weight.view(shape[0], -1)
-        w = w / (w.norm(p=2, dim=1, keepdim=True))
-        return F.conv1d(in_tensor, w.view(shape),
+        return (w / (w.norm(p=2, dim=1, keepdim=True))).view(shape)
+
+    def normalized_weight(self):
+        if not self.frozen or self.training:
+            return self._normalize()
+
+        key = (self.weight._version, self.weight.data_ptr(), self.weight.dtype, self.weight.device)
+        if self._cache_key != key:
+            with torch.no_grad():
+                self._cache = self._normalize()
+            self._cache_key = key
+        return self._cache
+
+    def forward(self, in_tensor):
+        return F.conv1d(in_tensor, self.normalized_weight(),
                         self.bias, self.stride, self.padding, self.dilation, self.groups)
 
 
+def freeze_weights(model, frozen=True):
+    """
+    Caches the normalised weights of all B-cos layers of the model for inference and explanations,
+    see NormedConv1d.freeze.
+    """
+    for mod in model.modules():
+        if isinstance(mod, NormedConv1d):
+            mod.freeze(frozen)
+
+
+def patch_norm(in_tensor, kernel_size, stride, padding, kssq, chunk_size=32):
+    """
+    Norm of every input patch plus the stabilising term, i.e. the norm of BcosConv1d.fwd_b. The squared norms are
+    summed over channel chunks so that no full-size x ** 2 tensor is materialised, and the patches are sum-pooled
+    directly instead of average pooled and upscaled by the kernel size. Kernel size 1 needs no pooling at all.
+    Args:
+        in_tensor: Input tensor. Expected shape: (B, C, L)
+        kernel_size, stride, padding, kssq: Configuration of the BcosConv1d layer.
+        chunk_size: Number of input channels squared at once.
+
+    Returns: The patch norms, shape (B, 1, L_out).
+
+    """
+    sq = None
+    for chunk in in_tensor.split(chunk_size, dim=1):
+        chunk_sq = (chunk * chunk).sum(1, keepdim=True)
+        sq = chunk_sq if sq is None else sq.add_(chunk_sq)
+
+    if kernel_size == 1 and padding == 0:
+        sq = sq[..., ::stride]
+    else:
+        kernel_size = tuple(np.atleast_1d(kernel_size))
+        sq = F.conv1d(sq, sq.new_ones((1, 1) + kernel_size), stride=stride, padding=padding)
+        # The average pooling was upscaled by kssq (the 2D kernel area), kept for trained models.
+        if kssq != np.prod(kernel_size):
+            sq = sq * (kssq / np.prod(kernel_size))
+
+    return (sq + 1e-6).sqrt_()
+
+
+def max_out_conv1d(in_tensor, weight, max_out, kernel_size, stride, padding, inplace=None):
+    """
+    Convolution with weight followed by MaxOut, equal to F.conv1d(...).view(B, -1, max_out, L).max(dim=2)[0].
+    The MaxOut slots are computed one after another and reduced with a running maximum, so neither the
+    outc * max_out channel output nor the int64 MaxOut indices are materialised. Kernel size 1 convolutions
+    are computed as matrix products.
+    Args:
+        in_tensor: Input tensor. Expected shape: (B, C, L)
+        weight: Convolution weight of shape (outc * max_out, C, kernel_size).
+        max_out, kernel_size, stride, padding: Configuration of the BcosConv1d layer.
+        inplace: Whether to reduce the slots in place, None decides by whether autograd needs the slot outputs.
+
+    Returns: The MaxOut output, shape (B, outc, L_out).
+
+    """
+    w = weight.view(-1, max_out, *weight.shape[1:])
+
+    pointwise = kernel_size == 1 and padding == 0
+    if pointwise:
+        in_tensor = in_tensor[..., ::stride]
+    if inplace is None:
+        inplace = not (torch.is_grad_enabled() and (in_tensor.requires_grad or w.requires_grad))
+
+    out = None
+    for slot in range(max_out):
+        if pointwise:
+            slot_out = torch.matmul(w[:, slot, :, 0], in_tensor)
+        else:
+            slot_out = F.conv1d(in_tensor, w[:, slot], None, stride, padding)
+
+        if out is None:
+            out = slot_out
+        elif inplace:
+            out = torch.maximum(out, slot_out, out=out)
+        else:
+            out = torch.maximum(out, slot_out)
+    return out
+
+
 class BcosConv1d(nn.Module):
 
     def __init__(self, inc, outc, kernel_size=1, stride=1, padding=0, max_out=2, b=2,
@@ -33,6 +142,8 @@ class BcosConv1d(nn.Module):
         self.kssq = ks ** 2 if not isinstance(ks, tuple) else np.prod(ks)
         self.padding = padding
         self.detach = False
+        # Number of input channels squared at once by patch_norm
+        self.norm_chunk_size = 32
         if scale is None:
             ks_scale = ks if not isinstance(ks, tuple) else np.sqrt(np.prod(ks))
             self.scale = (ks_scale * np.sqrt(self.inc)) / scale_fact
@@ -64,6 +175,33 @@ class BcosConv1d(nn.Module):
         """
         self.detach = detach
 
+    def dynamic_scale(self, in_tensor):
+        """
+        Decomposes the layer into its dynamic-linear form as used in explanation mode:
+        out = lin * scale, where lin is the MaxOut-selected output of the (linear) normed convolution.
+        Args:
+            in_tensor: Input tensor.
+
+        Returns: lin, the per-output scale (both of shape (B, outc / max_out, L)) and the MaxOut index
+                 of every output (None if max_out == 1).
+
+        """
+        lin = self.linear(in_tensor)
+
+        index = None
+        if self.max_out > 1:
+            bs, _, w = lin.shape
+            lin, index = lin.view(bs, -1, self.max_out, w).max(dim=2)
+
+        if self.b == 1:
+            return lin, torch.full_like(lin, 1 / self.scale), index
+
+        norm = self.patch_norm(in_tensor)
+
+        if self.b == 2:
+            return lin, lin.abs() / (norm * self.scale), index
+        return lin, ((lin / norm).abs() + 1e-6).pow(self.b - 1) / self.scale, index
+
     def fwd_b(self, in_tensor):
         # Simple linear layer
         out = self.linear(in_tensor)
@@ -96,27 +234,128 @@ class BcosConv1d(nn.Module):
         out = out * abs_cos.pow(self.b - 1)
         return out / self.scale
 
-    def fwd_2(self, in_tensor):
-        # Simple linear layer
-        out = self.linear(in_tensor)
+    def patch_norm(self, in_tensor):
+        return patch_norm(in_tensor, self.kernel_size, self.stride, self.padding, self.kssq, self.norm_chunk_size)
 
-        # MaxOut computation
-        if self.max_out > 1:
-            bs, h, w = out.shape
-            out = out.view(bs, -1, self.max_out, w)
-            out = out.max(dim=2, keepdim=False)[0]
+    def max_out_linear(self, in_tensor):
+        return max_out_conv1d(in_tensor, self.linear.normalized_weight(), self.max_out, self.kernel_size, self.stride,
+                              self.padding)
 
-        # Calculating the norm of input patches. Use average pooling and upscale by kernel size.
-        # TODO: implement directly as F.sum_pool1d...
-        norm = (F.avg_pool1d((in_tensor ** 2).sum(1, keepdim=True), self.kernel_size, padding=self.padding,
-                             stride=self.stride) * self.kssq + 1e-6  # stabilising term
-                ).sqrt_()
+    def fwd_2(self, in_tensor):
+        # Normed convolution and MaxOut computation
+        out = self.max_out_linear(in_tensor)
+
+        # Calculating the norm of input patches, the scale is folded into the (much smaller) norm tensor.
+        norm = self.patch_norm(in_tensor) * self.scale
 
         # In order to compute the explanations, we detach the dynamically calculated scaling from the graph.
         if self.detach:
-            out = (out * out.abs().detach())
-            norm = norm.detach()
+            return (out * out.abs().detach()) / norm.detach()
+        return (out * out.abs()) / norm
+
+
+class FoldedBcosConv1d(nn.Module):
+
+    def __init__(self, layer):
+        """
+        Inference-only copy of a BcosConv1d with b == 2 (or b == 1): the weights are normalised once and 1/scale is
+        folded into them, w / sqrt(scale) for b == 2 and w / scale for b == 1, so that a forward pass does no weight
+        normalisation and no division by the scale. The output equals the one of layer.
+        Args:
+            layer: The BcosConv1d to fold, it is not modified.
+        """
+        super().__init__()
+        if layer.b == 2:
+            gain = 1 / np.sqrt(layer.scale)
+        elif layer.b == 1:
+            gain = 1 / layer.scale
         else:
-            out = (out * out.abs())
+            raise ValueError(f"Only BcosConv1d layers with b == 1 or b == 2 can be folded, got b == {layer.b}")
+
+        with torch.no_grad():
+            self.register_buffer("weight", layer.linear.normalized_weight().detach() * gain)
+        self.b = layer.b
+        self.max_out = layer.max_out
+        self.kernel_size = layer.kernel_size
+        self.stride = layer.stride
+        self.padding = layer.padding
+        self.kssq = layer.kssq
+        self.norm_chunk_size = layer.norm_chunk_size
+        self.inplace = None
+
+    def forward(self, in_tensor):
+        out = max_out_conv1d(in_tensor, self.weight, self.max_out, self.kernel_size, self.stride, self.padding,
+                             self.inplace)
+        if self.b == 1:
+            return out
+        return out * out.abs() / patch_norm(in_tensor, self.kernel_size, self.stride, self.padding, self.kssq,
+                                            self.norm_chunk_size)
+
+
+def fold_scales(model):
+    """
+    Export for inference: returns an eval-mode copy of the model in which every BcosConv1d is replaced by its
+    FoldedBcosConv1d. The model itself is not modified.
+    """
+    def fold(module):
+        for name, child in module.named_children():
+            if isinstance(child, BcosConv1d):
+                setattr(module, name, FoldedBcosConv1d(child))
+            else:
+                fold(child)
+
+    model = copy.deepcopy(model).eval()
+    fold(model)
+    return model
+
+
+class QuantizedBcosConv1d(nn.Module):
+
+    def __init__(self, layer):
+        """
+        Dynamically int8 quantized copy of a pointwise (kernel size 1, no padding) FoldedBcosConv1d with b == 2.
+        The weights are quantized per output channel once, the activations per batch. The convolution of all MaxOut
+        slots is one int8 matrix product, the patch norm is computed in float32.
+        Args:
+            layer: The FoldedBcosConv1d to quantize, it is not modified.
+        """
+        super().__init__()
+        if layer.b != 2 or layer.kernel_size != 1 or layer.padding != 0:
+            raise ValueError("Only pointwise BcosConv1d layers with b == 2 can be quantized")
+
+        w = layer.weight.detach().float()[:, :, 0]
+        scales = w.abs().amax(dim=1).clamp_min(1e-12) / 127
+        qweight = torch.quantize_per_channel(w, scales.double(), torch.zeros(len(w), dtype=torch.long), 0,
+                                             torch.qint8)
+        self.packed = torch.ops.quantized.linear_prepack(qweight, None)
+        self.max_out = layer.max_out
+        self.stride = layer.stride
+        self.kssq = layer.kssq
+        self.norm_chunk_size = layer.norm_chunk_size
+
+    def forward(self, in_tensor):
+        x = in_tensor[..., ::self.stride]
+        bs, c, length = x.shape
+
+        out = torch.ops.quantized.linear_dynamic(x.transpose(1, 2).reshape(-1, c), self.packed)
+        out = out.view(bs, length, -1, self.max_out).amax(dim=3).transpose(1, 2)
+        return out * out.abs() / patch_norm(in_tensor, 1, self.stride, 0, self.kssq, self.norm_chunk_size)
+
+
+def quantize(model):
+    """
+    Returns an int8 inference copy of the model: the model is folded (see fold_scales), its pointwise B-cos layers
+    are replaced by QuantizedBcosConv1d and its linear layers are dynamically quantized. The model itself is not
+    modified.
+    """
+    def replace(module):
+        for name, child in module.named_children():
+            if isinstance(child, FoldedBcosConv1d) and child.b == 2 and child.kernel_size == 1 \
+                    and child.padding == 0:
+                setattr(module, name, QuantizedBcosConv1d(child))
+            else:
+                replace(child)
 
-        return out / (norm * self.scale)
+    model = fold_scales(model)
+    replace(model)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,29 @@
+import torch
+
+
+def select_device(device=None, num_threads=None):
+    """
+    Selects the device for B-cos training and explanations: CUDA if it is present, the CPU otherwise.
+    Args:
+        device: Explicit device (e.g. 'cpu' or 'cuda:1'), overrides the automatic selection.
+        num_threads: Number of intra-op threads used on the CPU, torch default (number of physical cores) if None.
+
+    Returns: torch.device
+
+    """
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = torch.device(device)
+
+    if device.type == "cpu" and num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    return device
+
+
+def empty_cache(device):
+    """
+    Releases cached device memory, only needed (and possible) on CUDA devices.
+    """
+    if torch.device(device).type == "cuda":
+        torch.cuda.empty_cache()
@@ -1,8 +1,11 @@
+import numpy as np
 import torch
 import torch.nn as nn
-from torch.autograd import Variable
+import torch.nn.functional as F
 
 import util
+from bcos.bcosconv1d import BcosConv1d
+from bcos.resnet1d_bcos import BasicBlock
 
 SOFTMAX = nn.Softmax(dim=0)
 
@@ -13,39 +16,202 @@ def explanation_mode(model, active=True):
             mod.explanation_mode(active)
 
 
-def explain_domain(model, embedding, test_domain):
-    test_domain_pp, _ = util.preprocess_data([test_domain], [0])
-    test_domain_pp_tensor = torch.from_numpy(test_domain_pp).cuda()
-    test_domain_pp_tensor_transformed = embedding(test_domain_pp_tensor)
+class Explanations:
+
+    def __init__(self, domains, valid, weights, contributions, offsets, alignment, classes, confidences):
+        """
+        Array-backed explanations of a batch of domains. The per-character weights and contributions of
+        domain i (without padding) are weights[offsets[i]:offsets[i + 1]] and contributions[offsets[i]:offsets[i + 1]].
+        Args:
+            domains: The explained domains, i.e. the valid input domains.
+            valid: Mask over the input domains that marks the explained ones.
+            weights: Normalised per-character weights, concatenated.
+            contributions: Normalised per-character contributions, concatenated.
+            offsets: Start of every domain in weights and contributions, followed by their total length.
+            alignment: Absolute difference between the logit and its dynamic-linear reconstruction per domain.
+            classes: Predicted class per domain.
+            confidences: Softmax probability of the predicted class per domain.
+        """
+        self.domains = domains
+        self.valid = valid
+        self.weights = weights
+        self.contributions = contributions
+        self.offsets = offsets
+        self.alignment = alignment
+        self.classes = classes
+        self.confidences = confidences
+
+    def __len__(self):
+        return len(self.domains)
+
+    def __getitem__(self, i):
+        """
+        Returns: (weights, contributions, alignment, class, confidence) of domain i like explain_domain.
+        """
+        s, e = self.offsets[i], self.offsets[i + 1]
+        return (self.weights[s:e], self.contributions[s:e], float(self.alignment[i]), int(self.classes[i]),
+                float(self.confidences[i]))
+
+
+def _record(module, x, tape):
+    """
+    Forward pass that records the dynamic scales of all B-cos layers (and the shapes needed to invert pooling and
+    flattening) on tape, so that the effective linear map can be applied in reverse afterwards.
+    """
+    if isinstance(module, nn.Sequential):
+        for mod in module:
+            x = _record(mod, x, tape)
+        return x
+
+    if isinstance(module, BcosConv1d):
+        lin, scale, index = module.dynamic_scale(x)
+        tape.append(("bcos", module, (scale, index, x.shape[-1])))
+        return lin * scale
+
+    if isinstance(module, BasicBlock):
+        block_tape = []
+        out = _record(module.conv1, x, block_tape)
+        out = _record(module.conv2, out, block_tape)
+        tape.append(("residual", module, block_tape))
+        return out + x
+
+    if isinstance(module, nn.AvgPool1d):
+        if not module.count_include_pad or module.ceil_mode:
+            raise NotImplementedError("Only AvgPool1d with count_include_pad=True and ceil_mode=False is supported.")
+        tape.append(("avg_pool", module, x.shape[-1]))
+    elif isinstance(module, nn.Flatten):
+        tape.append(("flatten", module, x.shape))
+    elif isinstance(module, nn.Linear):
+        tape.append(("linear", module, None))
+    else:
+        raise NotImplementedError(f"{type(module).__name__} is not supported by the dynamic-linear explanation.")
+
+    return module(x)
+
+
+def _transpose_length(length_in, length_out, kernel_size, stride, padding):
+    # output_padding that makes conv_transpose1d restore the input length
+    return length_in - ((length_out - 1) * stride - 2 * padding + kernel_size)
+
+
+def _propagate(tape, v):
+    """
+    Applies the transposed effective linear maps recorded on tape to v, from the output back to the input.
+    """
+    for kind, module, data in reversed(tape):
+        if kind == "linear":
+            v = v @ module.weight
+        elif kind == "flatten":
+            v = v.view(data)
+        elif kind == "residual":
+            v = v + _propagate(data, v)
+        elif kind == "avg_pool":
+            bs, c, length = v.shape
+            k, stride, padding = module.kernel_size[0], module.stride[0], module.padding[0]
+            kernel = torch.full((1, 1, k), 1 / k, dtype=v.dtype, device=v.device)
+            v = F.conv_transpose1d(v.reshape(bs * c, 1, length), kernel, stride=stride, padding=padding,
+                                   output_padding=_transpose_length(data, length, k, stride, padding))
+            v = v.view(bs, c, data)
+        else:
+            scale, index, length_in = data
+            u = v * scale
+            if index is not None:
+                bs, c, length = u.shape
+                full = torch.zeros((bs, c, module.max_out, length), dtype=u.dtype, device=u.device)
+                u = full.scatter_(2, index[:, :, None], u[:, :, None]).view(bs, -1, length)
 
-    domain = test_domain_pp_tensor_transformed[0]
-    _domain = Variable(domain, requires_grad=True)
-    _domain = _domain[None, :]
+            v = F.conv_transpose1d(u, module.linear.normalized_weight(), stride=module.stride, padding=module.padding,
+                                   output_padding=_transpose_length(length_in, u.shape[-1], module.kernel_size,
+                                                                    module.stride, module.padding))
+    return v
 
-    pred = model(_domain)
-    x = (torch.argmax(pred[0]))
-    cls = x.item()
-    cnf = SOFTMAX(pred[0])[x].item()
 
-    _domain.retain_grad()
-    _domain.grad = None
-    pred[0][x].backward(retain_graph=True)
-    w = _domain.grad
+def dynamic_linear_weights(model, inp, classes=None):
+    """
+    Computes the effective (dynamic-linear) weights of the B-cos model w.r.t. its input without autograd:
+    one recording forward pass followed by applying the transposed effective linear maps of the final Linear,
+    flattening, the residual blocks, their BcosConv1d layers and the average pooling layers.
+    The result equals the input gradient in explanation mode (detached dynamic scales).
+    Args:
+            model: Sequential B-cos model without its embedding (like for explain_domain).
+            inp: Embedded input of shape (B, max_len, embedding_dim).
+            classes: Class to explain per row, the predicted class if None.
 
-    linearity = ((_domain * w).sum() + model[-1].bias)
-    if linearity.shape != ():
-        linearity = linearity[x]
+    Returns: The model output, the explained classes and the weights (same shape as inp).
 
-    alignment = abs(pred[0][x].item() - linearity.item())
+    """
+    with torch.no_grad():
+        tape = []
+        pred = _record(model, inp, tape)
+        if classes is None:
+            classes = torch.argmax(pred, dim=1)
 
-    w_no_padding = torch.squeeze(w)[253 - len(test_domain):]
-    x_no_padding = torch.squeeze(_domain)[253 - len(test_domain):]
+        v = F.one_hot(classes, pred.shape[1]).to(pred.dtype)
+        return pred, classes, _propagate(tape, v)
 
-    con = x_no_padding * w_no_padding
-    con = torch.sum(con, dim=1)
-    con = torch.div(con, torch.max(torch.abs(con))).cpu().detach().tolist()
 
-    w_no_padding = torch.sum(w_no_padding, dim=1)
-    w_no_padding = torch.div(w_no_padding, torch.max(torch.abs(w_no_padding))).cpu().detach().tolist()
+def _normalise_rows(values, mask):
+    return values / torch.where(mask, values.abs(), torch.zeros_like(values)).amax(dim=1, keepdim=True)
 
-    return w_no_padding, con, alignment, cls, cnf
+
+def explain_domains(model, embedding, domains, batch_size=256, dynamic_linear=False):
+    """
+    Explains a batch of domains with one forward and one backward pass per batch_size domains.
+    Every row is explained w.r.t. its own predicted class, padding is trimmed per row.
+    Domains with invalid characters are skipped, see Explanations.valid.
+    With dynamic_linear, the weights are computed without autograd by dynamic_linear_weights.
+    """
+    x, valid = util.encode_domains(domains, dtype=np.int64)
+    domains = [d for (d, v) in zip(domains, valid) if v]
+    lengths = np.minimum([len(d) for d in domains], x.shape[1]).astype(np.int64)
+
+    bias = model[-1].bias
+    device = embedding.weight.device
+    positions = torch.arange(x.shape[1], device=device)
+
+    weights, contributions, alignment, classes, confidences = [], [], [], [], []
+    for start in range(0, len(x), batch_size):
+        end = start + batch_size
+
+        if dynamic_linear:
+            with torch.no_grad():
+                inp = embedding(torch.from_numpy(x[start:end]).to(device))
+            pred, cls, w = dynamic_linear_weights(model, inp)
+        else:
+            inp = embedding(torch.from_numpy(x[start:end]).to(device)).detach().requires_grad_(True)
+            pred = model(inp)
+            cls = torch.argmax(pred, dim=1)
+
+            # Rows are independent, so the gradient of the sum holds the gradient of every row w.r.t. its own class.
+            w, = torch.autograd.grad(pred.gather(1, cls[:, None]).sum(), inp)
+
+        with torch.no_grad():
+            out = pred.gather(1, cls[:, None])[:, 0]
+            con = (inp * w).sum(dim=2)
+            linearity = con.sum(dim=1)
+            if bias is not None:
+                linearity = linearity + bias[cls]
+
+            mask = positions[None, :] >= x.shape[1] - torch.from_numpy(lengths[start:end]).to(device)[:, None]
+
+            weights.append(_normalise_rows(w.sum(dim=2), mask)[mask].cpu().numpy())
+            contributions.append(_normalise_rows(con, mask)[mask].cpu().numpy())
+            alignment.append((out - linearity).abs().cpu().numpy())
+            classes.append(cls.cpu().numpy())
+            confidences.append(torch.softmax(pred, dim=1).gather(1, cls[:, None])[:, 0].cpu().numpy())
+
+    def concat(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+    return Explanations(domains, valid,
+                        weights=concat(weights, np.float32),
+                        contributions=concat(contributions, np.float32),
+                        offsets=np.concatenate(([0], np.cumsum(lengths))),
+                        alignment=concat(alignment, np.float32),
+                        classes=concat(classes, np.int64),
+                        confidences=concat(confidences, np.float32))
+
+
+def explain_domain(model, embedding, test_domain):
+    w, con, alignment, cls, cnf = explain_domains(model, embedding, [test_domain])[0]
+    return w.tolist(), con.tolist(), alignment, cls, cnf
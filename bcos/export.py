@@ -0,0 +1,80 @@
+import numpy as np
+import torch
+
+import settings
+from bcos.bcosconv1d import FoldedBcosConv1d, fold_scales
+
+
+def _example(max_len):
+    return torch.zeros((1, max_len), dtype=torch.long)
+
+
+def export_torchscript(model, path, max_len=settings.maxlen):
+    """
+    Exports the B-cos ResNet (or any model of BcosConv1d layers) to TorchScript. The model is folded (see fold_scales)
+    and traced for inputs of max_len characters, which resolves the b == 2 branch, the kernel size 1 path and the
+    MaxOut loop of every layer at export time. The graph is frozen, i.e. weights and attributes become constants.
+    The batch dimension stays dynamic.
+    Args:
+        model: The model to export, it is not modified.
+        path: Output file.
+        max_len: Length of the encoded domains.
+
+    Returns: The exported graph.
+
+    """
+    with torch.no_grad():
+        graph = torch.jit.freeze(torch.jit.trace(fold_scales(model).cpu(), _example(max_len)))
+    torch.jit.save(graph, path)
+    return graph
+
+
+def export_onnx(model, path, max_len=settings.maxlen, opset_version=17):
+    """
+    Exports the folded model like export_torchscript to ONNX with a dynamic batch dimension.
+    Requires the onnx package, the model is not modified.
+    """
+    folded = fold_scales(model).cpu()
+    for mod in folded.modules():
+        if isinstance(mod, FoldedBcosConv1d):
+            mod.inplace = False
+
+    with torch.no_grad():
+        torch.onnx.export(folded, (_example(max_len),), path, input_names=["domains"], output_names=["logits"],
+                          dynamic_axes={"domains": {0: "batch"}, "logits": {0: "batch"}},
+                          opset_version=opset_version, dynamo=False)
+
+
+class Runner:
+
+    def __init__(self, path, num_threads=None):
+        """
+        Runs an exported B-cos graph on the CPU: ONNX files (.onnx) with ONNX Runtime, everything else with
+        the TorchScript runtime.
+        Args:
+            path: File written by export_torchscript or export_onnx.
+            num_threads: Number of intra-op threads, runtime default if None.
+        """
+        self.path = path
+        if path.endswith(".onnx"):
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if num_threads is not None:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self.graph = None
+        else:
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+            self.session = None
+            self.graph = torch.jit.load(path, map_location="cpu")
+
+    def __call__(self, x):
+        """
+        Returns: The logits of the encoded domains x (int array of shape (B, max_len)) as numpy array.
+        """
+        if self.session is not None:
+            return self.session.run(None, {"domains": np.asarray(x, dtype=np.int64)})[0]
+        with torch.no_grad():
+            return self.graph(torch.as_tensor(x).long()).numpy()
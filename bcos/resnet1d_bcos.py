@@ -1,3 +1,5 @@
+import numpy as np
+import torch
 import torch.nn as nn
 from torch import Tensor
 from bcos.bcosconv1d import BcosConv1d
@@ -61,12 +63,14 @@ class ResNet(nn.Module):
         self.layer11 = block(self.planes, self.planes, 1, 1)
         self.flatten = nn.Flatten()
         self.fc = nn.Linear(self.planes, num_classes)
+        self._sequential = None
 
-    def get_features(self, x):
-        return self.get_sequential_model()[:-1](x)
+    @property
+    def device(self):
+        return self.fc.weight.device
 
-    def get_sequential_model(self):
-        model = nn.Sequential(
+    def _layers(self):
+        return (
             self.embedding,
             self.upscale,
             self.layer1,
@@ -91,7 +95,39 @@ class ResNet(nn.Module):
             self.flatten,
             self.fc
         )
-        return model
+
+    def _views(self):
+        # The sequential view shares the modules of the model. It is kept in a tuple, so it is neither registered as
+        # submodule nor part of the state dict, and only rebuilt when a layer was replaced (e.g. by fold_scales).
+        children = tuple(self._modules.values())
+        if self._sequential is None or self._sequential[0] != children:
+            model = nn.Sequential(*self._layers())
+            self._sequential = (children, model, model[:-1])
+        return self._sequential
+
+    def get_features(self, x):
+        return self._views()[2](x)
+
+    def get_sequential_model(self):
+        return self._views()[1]
+
+    def extract_features(self, x, batch_size=1024):
+        """
+        Penultimate features (input of the final linear layer) of many domains, e.g. to cluster DGA families.
+        Args:
+            x: Encoded domains of shape (N, max_len), see util.encode_domains. Numpy array or tensor.
+            batch_size: Number of domains per forward pass.
+
+        Returns: C-contiguous float32 numpy array of shape (N, planes).
+
+        """
+        features = self._views()[2]
+        out = np.empty((len(x), self.planes), dtype=np.float32)
+        with torch.no_grad():
+            for start in range(0, len(x), batch_size):
+                batch = torch.as_tensor(x[start:start + batch_size], device=self.device).long()
+                out[start:start + len(batch)] = features(batch).float().cpu().numpy()
+        return out
 
     def _forward_impl(self, x: Tensor) -> Tensor:
         # See note [TorchScript super()]
@@ -128,6 +164,3 @@ class ResNet(nn.Module):
 
     def forward(self, x: Tensor) -> Tensor:
         return self._forward_impl(x)
-
-    def backward(self, x: Tensor) -> Tensor:
-        return x
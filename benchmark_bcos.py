@@ -0,0 +1,122 @@
+import os
+import copy
+import time
+import tempfile
+import importlib.util
+import torch
+
+import settings
+from bcos.bcosconv1d import BcosConv1d, freeze_weights, fold_scales
+from bcos.device import select_device
+from bcos.export import export_torchscript, export_onnx, Runner
+from bcos.resnet1d_bcos import ResNet
+from bcos.explain_bcos import explanation_mode, dynamic_linear_weights
+from check_bcos import reference_fwd_2
+
+
+def forward_throughput(model, batch_size, device, repeat=10):
+    x = torch.randint(1, settings.max_features, (batch_size, settings.maxlen), device=device)
+
+    with torch.no_grad():
+        model(x)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model(x)
+        elapsed = time.perf_counter() - start
+
+    return batch_size * repeat / elapsed
+
+
+def runner_throughput(runner, batch_size, repeat=10):
+    x = torch.randint(1, settings.max_features, (batch_size, settings.maxlen)).numpy()
+
+    runner(x)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        runner(x)
+    return batch_size * repeat / (time.perf_counter() - start)
+
+
+def bcos_layer(layer, batch_size, length, device, repeat=10):
+    x = torch.randn((batch_size, layer.inc, length), device=device)
+
+    timings = {}
+    with torch.no_grad():
+        for name, fn in [("reference", lambda: reference_fwd_2(layer, x)), ("fused", lambda: layer(x))]:
+            fn()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            timings[name] = batch_size * repeat / (time.perf_counter() - start)
+    return timings
+
+
+def explanation_weights(model, embedding, batch_size, device, repeat=3):
+    x = torch.randint(1, settings.max_features, (batch_size, settings.maxlen), device=device)
+    with torch.no_grad():
+        inp = embedding(x)
+
+    def autograd_weights(model, inp):
+        inp = inp.clone().requires_grad_(True)
+        pred = model(inp)
+        cls = torch.argmax(pred, dim=1)
+        return torch.autograd.grad(pred.gather(1, cls[:, None]).sum(), inp)[0]
+
+    def closed_form_weights(model, inp):
+        return dynamic_linear_weights(model, inp)[2]
+
+    timings = {}
+    for name, fn in [("autograd", autograd_weights), ("dynamic-linear", closed_form_weights)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(model, inp)
+        timings[name] = batch_size * repeat / (time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    device = select_device("cpu")
+    model = ResNet().to(device).eval()
+
+    layers = [("kernel_size=1", BcosConv1d(256, 256)),
+              ("kernel_size=3", BcosConv1d(256, 256, kernel_size=3, padding=1)),
+              ("kernel_size=3 stride=2", BcosConv1d(256, 256, kernel_size=3, stride=2))]
+    for name, layer in layers:
+        for batch_size in [1, 256]:
+            for impl, throughput in bcos_layer(layer.to(device), batch_size, 64, device).items():
+                print(f"BcosConv1d {name:<22s} {impl:<9s} batch_size={batch_size:<4d} {throughput:.0f} domains/s")
+
+    frozen = copy.deepcopy(model)
+    freeze_weights(frozen)
+    variants = [("", model), ("frozen", frozen), ("folded", fold_scales(model))]
+
+    for num_threads in sorted({1, torch.get_num_threads()}):
+        torch.set_num_threads(num_threads)
+        for batch_size in [1, 16, 256]:
+            for name, variant in variants:
+                print(f"ResNet.forward {name:<6s} threads={num_threads:<3d} batch_size={batch_size:<4d} "
+                      f"{forward_throughput(variant, batch_size, device):.0f} domains/s")
+
+    torch.set_num_threads(1)
+    x = torch.randint(1, settings.max_features, (4096, settings.maxlen)).numpy()
+    start = time.perf_counter()
+    frozen.extract_features(x)
+    print(f"ResNet.extract_features frozen threads=1   {len(x) / (time.perf_counter() - start):.0f} domains/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_torchscript(model, os.path.join(tmp, "model.pt"))
+        runners = [("torchscript", Runner(os.path.join(tmp, "model.pt")))]
+        if importlib.util.find_spec("onnxruntime") is not None:
+            export_onnx(model, os.path.join(tmp, "model.onnx"))
+            runners.append(("onnxruntime", Runner(os.path.join(tmp, "model.onnx"), num_threads=1)))
+
+        for name, runner in runners:
+            for batch_size in [1, 16, 256]:
+                print(f"exported {name:<12s} threads=1   batch_size={batch_size:<4d} "
+                      f"{runner_throughput(runner, batch_size):.0f} domains/s")
+
+    sequential = model.get_sequential_model()
+    explanation_mode(sequential)
+    for batch_size in [1, 64]:
+        for name, throughput in explanation_weights(sequential[1:], sequential[0], batch_size, device).items():
+            print(f"explanation {name:<15s} batch_size={batch_size:<4d} {throughput:.0f} domains/s")
@@ -0,0 +1,65 @@
+import time
+import numpy as np
+
+import util
+import dataset
+import pipeline
+import settings
+from models import resnet_multiclass
+
+
+def predict_batches(model, x, batch_size=256):
+    return np.concatenate([np.asarray(model.predict_on_batch(x[start:start + batch_size]))
+                           for start in range(0, len(x), batch_size)])
+
+
+def throughput(fn, nb_domains, repeat=3):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return nb_domains * repeat / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    data = dataset.load(settings.DS_MODELS_PATH)
+    x, valid = dataset.load_encoded(data)
+    lengths = np.minimum(np.diff(data.offsets), settings.maxlen)
+    rows = np.flatnonzero(valid)[:20000]
+    domains = data.domains(rows)
+    x_rows = np.asarray(x[rows])
+
+    # The last width columns of the left-padded rows equal the domains encoded for exactly that width.
+    widths = util.bucket_widths(lengths[rows])
+    for width in np.unique(widths):
+        bucket = np.flatnonzero(widths == width)
+        expected, _ = util.encode_domains([domains[i] for i in bucket], maxlen=width)
+        assert np.array_equal(x_rows[bucket, -width:], expected)
+
+    # Every training batch holds a single bucket.
+    train_ds = pipeline.from_encoded(x, data.labels, rows, lengths=lengths, batch_size=256)
+    for batch, _ in train_ds.as_numpy_iterator():
+        batch_lengths = np.count_nonzero(batch, axis=1)
+        assert np.all(util.bucket_widths(batch_lengths) == batch.shape[1])
+
+    fixed, _ = resnet_multiclass.build_model()
+    bucketed, _ = resnet_multiclass.build_model(variable_length=True)
+    bucketed.set_weights(fixed.get_weights())
+
+    # A domain is scored the same in a mixed batch and alone at its bucket width.
+    pred = util.predict_bucketed(lambda b: predict_batches(bucketed, b), x_rows, lengths[rows])
+    for i in np.linspace(0, len(rows) - 1, 16).astype(int):
+        alone, _ = util.encode_domains([domains[i]], maxlen=widths[i])
+        assert np.allclose(pred[i], np.asarray(bucketed.predict_on_batch(alone))[0], rtol=1e-4, atol=1e-6)
+
+    print(f"mean length {lengths[rows].mean():.1f}, bucket shares "
+          + ", ".join(f"{w}: {np.mean(widths == w):.2f}" for w in settings.length_buckets))
+
+    def fixed_predict():
+        return predict_batches(fixed, x_rows)
+
+    def bucketed_predict():
+        return util.predict_bucketed(lambda b: predict_batches(bucketed, b), x_rows, lengths[rows])
+
+    print(f"M-ResNet maxlen={settings.maxlen} {throughput(fixed_predict, len(rows)):.0f} domains/s")
+    print(f"M-ResNet bucketed   {throughput(bucketed_predict, len(rows)):.0f} domains/s")
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+import cache
+import serve
+import dataset
+import settings
+import artifacts
+
+
+def score_batches(scorer, domains, batch_size):
+    """
+    Returns: The classes and confidences of scorer.score over batches of the domains and the throughput in domains/s.
+    """
+    start = time.perf_counter()
+    out = [scorer.score(domains[i:i + batch_size]) for i in range(0, len(domains), batch_size)]
+    throughput = len(domains) / (time.perf_counter() - start)
+    return np.concatenate([c for (c, _) in out]), np.concatenate([p for (_, p) in out]), throughput
+
+
+def attached_lookup(name, keys):
+    """
+    Returns: The mask of keys found by a separate Python process attached to the shared cache name.
+    """
+    code = ("import sys, json, cache\n"
+            "attached = cache.SharedScoreCache(sys.argv[1], create=False)\n"
+            "print(json.dumps(attached.get(json.load(sys.stdin))[2].tolist()))\n"
+            "attached.close()\n")
+    out = subprocess.run([sys.executable, '-c', code, name], input=json.dumps(keys), capture_output=True, text=True,
+                         check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return np.array(json.loads(out.stdout), dtype=bool)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and hit ratio of the scoring caches.")
+    parser.add_argument('--model', required=True, help="Directory of a model artifact.")
+    parser.add_argument('--distinct', type=int, default=5000, help="Number of distinct domains of the stream.")
+    parser.add_argument('--samples', type=int, default=50000, help="Length of the stream.")
+    parser.add_argument('--zipf', type=float, default=1.2, help="Exponent of the Zipf distribution of the stream.")
+    parser.add_argument('--cache-size', type=int, default=2 ** 12)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    # DNS logs are dominated by few names: the stream draws the distinct domains by a Zipf distribution.
+    data = dataset.load(settings.DS_MODELS_PATH)
+    rng = np.random.default_rng(0)
+    distinct = data.domains(rng.choice(len(data), min(args.distinct, len(data)), replace=False))
+    ranks = np.minimum(rng.zipf(args.zipf, args.samples), len(distinct)) - 1
+    stream = [distinct[r] for r in ranks]
+
+    scorer = serve.Scorer(artifacts.load(args.model))
+    scorer.score(stream[:args.batch_size])
+    classes, confidences, throughput = score_batches(scorer, stream, args.batch_size)
+    print(f"{len(distinct)} distinct domains, {len(stream)} lookups")
+    print(f"{'uncached':<12s} {throughput:8.0f} domains/s")
+
+    shared = cache.SharedScoreCache(nb_slots=args.cache_size)
+    try:
+        for name, score_cache in [("lru", cache.ScoreCache(args.cache_size)), ("shared", shared)]:
+            cached = cache.CachedScorer(scorer, score_cache)
+            cached_classes, cached_confidences, cached_throughput = score_batches(cached, stream, args.batch_size)
+            # Scorer and CachedScorer both score the normalized domains, so the cache does not change the results.
+            assert np.array_equal(classes, cached_classes)
+            assert np.allclose(confidences, cached_confidences, rtol=1e-4, atol=1e-6)
+
+            stats = score_cache.stats()
+            print(f"{name:<12s} {cached_throughput:8.0f} domains/s hit ratio={stats['cache_hit_ratio']:.3f} "
+                  f"evictions={stats['cache_evictions']}")
+
+        # A second process attaching to the block by name finds what the creator finds.
+        keys = [cache.normalize(d) for d in distinct]
+        _, _, expected = shared.get(keys)
+        assert np.array_equal(attached_lookup(shared.name, keys), expected)
+    finally:
+        shared.close(unlink=True)
@@ -0,0 +1,80 @@
+import time
+import argparse
+import numpy as np
+
+import serve
+import dataset
+import settings
+import artifacts
+
+
+def score_batches(scorer, domains, batch_size):
+    """
+    Returns: The classes of scorer.score over batches of the domains and the throughput in domains/s.
+    """
+    start = time.perf_counter()
+    classes = np.concatenate([scorer.score(domains[i:i + batch_size])[0] for i in range(0, len(domains), batch_size)])
+    return classes, len(domains) / (time.perf_counter() - start)
+
+
+def held_out_rows(data, artifact, binary, fold, random_state):
+    """
+    Returns: The test rows of the split the artifact was trained on, of the given split if it records none.
+    """
+    split = artifact.split or artifacts.split_parameters(fold, binary=binary, random_state=random_state)
+    return artifacts.split_indices(data, split)[1]
+
+
+def recalls(classes, y):
+    """
+    Returns: Share of malicious domains classified as malicious and attributed to their family.
+    """
+    malicious = y != 0
+    return np.mean(classes[malicious] > 0), np.mean(classes[malicious] == y[malicious])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs. recall of the B-ResNet gated cascade.")
+    parser.add_argument('--gate', required=True, help="Directory of a B-ResNet artifact.")
+    parser.add_argument('--model', required=True, help="Directory of a multiclass artifact.")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.01, 0.05, 0.1, 0.3, 0.5])
+    parser.add_argument('--samples', type=int, default=20000, help="Number of held-out domains to score.")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--fold', type=int, default=0,
+                        help="Fold of artifacts that do not record their split, see artifacts.split_parameters.")
+    parser.add_argument('--random-state', type=int, default=settings.split_random_state,
+                        help="random_state of dataset.DomainDataset.split, for artifacts that do not record it.")
+    args = parser.parse_args()
+
+    gate_artifact, model_artifact = artifacts.load(args.gate), artifacts.load(args.model)
+
+    # The domains are held out by both models: test rows of the splits they were trained on.
+    data = dataset.load(settings.DS_MODELS_PATH)
+    _, valid = dataset.load_encoded(data)
+    test = np.intersect1d(held_out_rows(data, gate_artifact, True, args.fold, args.random_state),
+                          held_out_rows(data, model_artifact, False, args.fold, args.random_state))
+    rows = np.sort(np.random.default_rng(0).permutation(test[valid[test]])[:args.samples])
+    domains = data.domains(rows)
+    y = np.asarray(data.labels[rows])
+    print(f"{len(rows)} domains, {np.mean(y == 0):.2f} benign")
+
+    gate = serve.Scorer(gate_artifact)
+    scorer = serve.Scorer(model_artifact)
+
+    # Warm-up of both models, the first calls trace the graphs.
+    gate.score(domains[:args.batch_size])
+    scorer.score(domains[:args.batch_size])
+
+    classes, throughput = score_batches(scorer, domains, args.batch_size)
+    detection, attribution = recalls(classes, y)
+    print(f"{'multiclass only':<18s} {throughput:8.0f} domains/s forwarded=1.00 "
+          f"detection recall={detection:.4f} attribution recall={attribution:.4f}")
+
+    for threshold in args.thresholds:
+        cascade = serve.CascadeScorer(gate, scorer, threshold)
+        cascade_classes, cascade_throughput = score_batches(cascade, domains, args.batch_size)
+        cascade_detection, cascade_attribution = recalls(cascade_classes, y)
+        print(f"cascade t={threshold:<8.3g} {cascade_throughput:8.0f} domains/s "
+              f"forwarded={cascade.nb_forwarded / cascade.nb_domains:.2f} "
+              f"detection recall={cascade_detection:.4f} ({cascade_detection - detection:+.4f}) "
+              f"attribution recall={cascade_attribution:.4f} ({cascade_attribution - attribution:+.4f})")
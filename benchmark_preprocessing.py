@@ -0,0 +1,36 @@
+import timeit
+import numpy as np
+from tensorflow.keras.preprocessing import sequence
+
+import util
+import settings
+
+
+def preprocess_data_reference(X_data):
+    domainnames = [x for x in X_data if len([c for c in x if c not in settings.valid_chars]) == 0]
+    domains = [[settings.valid_chars[y] for y in x] for x in domainnames]
+    return sequence.pad_sequences(domains, maxlen=settings.maxlen)
+
+
+def random_domains(n, seed=0):
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list(settings.valid_chars) + ['!', 'ä'])
+    lengths = rng.integers(1, 64, size=n)
+    return ["".join(rng.choice(alphabet, size=length)) for length in lengths]
+
+
+if __name__ == "__main__":
+    nb_domains = 100000
+    repeat = 3
+
+    domains = random_domains(nb_domains)
+
+    encoded, _ = util.encode_domains(domains)
+    assert np.array_equal(encoded, preprocess_data_reference(domains))
+
+    t_reference = min(timeit.repeat(lambda: preprocess_data_reference(domains), number=1, repeat=repeat))
+    t_encode = min(timeit.repeat(lambda: util.encode_domains(domains), number=1, repeat=repeat))
+
+    print(f"reference:      {t_reference:.3f}s ({nb_domains / t_reference:.0f} domains/s)")
+    print(f"encode_domains: {t_encode:.3f}s ({nb_domains / t_encode:.0f} domains/s)")
+    print(f"speedup:        {t_reference / t_encode:.1f}x")
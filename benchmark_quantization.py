@@ -0,0 +1,57 @@
+import argparse
+import numpy as np
+
+import artifacts
+import dataset
+import settings
+import quantization
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-class accuracy vs. throughput of int8 quantized models.")
+    parser.add_argument('--model', required=True, help="Directory of an M-ResNet, B-ResNet or B-cos artifact.")
+    parser.add_argument('--calibration-samples', type=int, default=1024)
+    parser.add_argument('--samples', type=int, default=20000, help="Number of domains to evaluate on.")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--fold', type=int, default=0,
+                        help="Fold of artifacts that do not record their split, see artifacts.split_parameters.")
+    args = parser.parse_args()
+
+    metadata = artifacts.load_metadata(args.model)
+    family = metadata['family']
+    if family not in ('m-resnet', 'b-resnet', 'b-cos'):
+        parser.error(f"quantization is not supported for {family}")
+    model = artifacts.load_model(args.model)
+
+    # Calibration domains are drawn from the training rows of the split the model was trained on, evaluation domains
+    # from its test rows, both balanced over classes.
+    data = dataset.load(settings.DS_MODELS_PATH)
+    split = metadata.get('split') or artifacts.split_parameters(args.fold, binary=family == 'b-resnet')
+    train, test = artifacts.split_indices(data, split)
+    labels = np.asarray(data.labels[:])
+
+    calibration_rows = train[quantization.calibration_indices(labels[train], args.calibration_samples, random_state=0)]
+    x_calibration, _, calibration_lengths = quantization.encoded_samples(data, calibration_rows)
+
+    evaluation_rows = test[quantization.calibration_indices(labels[test], args.samples, random_state=1)]
+    x, y, lengths = quantization.encoded_samples(data, evaluation_rows)
+    buckets = metadata.get('length_buckets')
+
+    if family == 'b-cos':
+        import torch
+        from bcos.bcosconv1d import fold_scales, quantize
+
+        torch.set_num_threads(args.threads)
+        variants = [("float32", quantization.torch_predict(fold_scales(model), args.batch_size)),
+                    ("int8", quantization.torch_predict(quantize(model), args.batch_size))]
+    else:
+        variants = [("float32", quantization.batched(artifacts.from_model(model, family).predict, args.batch_size))]
+        for name, int8 in [("tflite float32", False), ("tflite int8", True)]:
+            content = quantization.quantize_keras(model, x_calibration, int8=int8, lengths=calibration_lengths,
+                                                  buckets=buckets)
+            variants.append((name, quantization.TFLiteModel(content, args.batch_size, args.threads)))
+        if buckets:
+            # Variable-length M-ResNets are evaluated like serve.Scorer runs them, each length bucket at its width.
+            variants = [(name, quantization.bucketed(predict, lengths, buckets)) for (name, predict) in variants]
+
+    quantization.report(variants, x, y, binary=family == 'b-resnet')
@@ -0,0 +1,239 @@
+import time
+import hashlib
+import threading
+import collections
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+def normalize(domain):
+    """
+    Cache key of a domain: DNS names are case-insensitive and may be written fully qualified with a trailing dot.
+    """
+    return domain.strip().rstrip('.').lower()
+
+
+class ScoreCache:
+
+    def __init__(self, max_size=2 ** 16, ttl=None):
+        """
+        Bounded LRU cache of (class, confidence) per domain, local to the process.
+
+        Args:
+            max_size: Number of domains kept, the least recently used domain is evicted beyond.
+            ttl: Seconds after which an entry expires, None keeps entries until they are evicted.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, keys):
+        """
+        Returns: The classes and confidences of the keys and a boolean mask of the keys found.
+        """
+        classes = np.full(len(keys), -1, dtype=np.int64)
+        confidences = np.zeros(len(keys), dtype=np.float32)
+        found = np.zeros(len(keys), dtype=bool)
+        now = time.monotonic()
+
+        with self.lock:
+            for i, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                if entry[2] < now:
+                    del self.entries[key]
+                    self.expirations += 1
+                    continue
+                self.entries.move_to_end(key)
+                classes[i], confidences[i], _ = entry
+                found[i] = True
+
+            self.hits += int(found.sum())
+            self.misses += len(keys) - int(found.sum())
+        return classes, confidences, found
+
+    def put(self, keys, classes, confidences):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+
+        with self.lock:
+            for key, cls, confidence in zip(keys, classes.tolist(), confidences.tolist()):
+                self.entries[key] = (cls, confidence, expires)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cache_size': len(self.entries),
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_evictions': self.evictions,
+            'cache_expirations': self.expirations,
+            'cache_hit_ratio': self.hits / lookups if lookups else 0.,
+        }
+
+
+class SharedScoreCache:
+    """
+    Cache of (class, confidence) per domain in a named shared memory block, so that several serving processes
+    reuse each others results. The block is a set-associative table: a domain is stored under its 64 bit hash in
+    one of the ways of set hash % nb_sets, a full set evicts its least recently used way.
+    There is no lock between the processes. Writers clear the key of a slot before updating it and readers only
+    accept a slot whose key did not change while it was read; a race between two writers at worst loses an entry.
+    The hit/miss/eviction counters are those of the process.
+    """
+    HEADER = 16
+    SLOT = np.dtype([('key', np.uint64), ('used', np.float64), ('expires', np.float64),
+                     ('cls', np.int32), ('confidence', np.float32)])
+
+    def __init__(self, name=None, nb_slots=2 ** 20, ways=8, ttl=None, create=True):
+        """
+        Args:
+            name: Name of the shared memory block, None generates one (see the name attribute).
+            nb_slots: Number of domains the table holds, rounded down to a multiple of ways.
+            ways: Associativity of the table.
+            ttl: Seconds after which an entry expires, None keeps entries until they are evicted.
+            create: Creates the block, otherwise attaches to the existing block name and takes its geometry.
+        """
+        if create:
+            nb_sets = max(nb_slots // ways, 1)
+            self.memory = shared_memory.SharedMemory(name, create=True,
+                                                     size=self.HEADER + nb_sets * ways * self.SLOT.itemsize)
+            np.ndarray(2, dtype=np.int64, buffer=self.memory.buf)[:] = (nb_sets, ways)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            # Only the creator owns the block, the resource tracker would remove it when an attached process exits.
+            resource_tracker.unregister(self.memory._name, 'shared_memory')
+        self.name = self.memory.name
+
+        nb_sets, ways = np.ndarray(2, dtype=np.int64, buffer=self.memory.buf).tolist()
+        self.table = np.ndarray((nb_sets, ways), dtype=self.SLOT, buffer=self.memory.buf, offset=self.HEADER)
+        if create:
+            self.table[:] = 0
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def hash(keys):
+        h = np.fromiter((int.from_bytes(hashlib.blake2b(k.encode(), digest_size=8).digest(), 'little') for k in keys),
+                        dtype=np.uint64, count=len(keys))
+        # 0 marks empty slots.
+        h[h == 0] = 1
+        return h
+
+    def _sets(self, h):
+        return (h % np.uint64(len(self.table))).astype(np.int64)
+
+    def get(self, keys):
+        """
+        Returns: The classes and confidences of the keys and a boolean mask of the keys found.
+        """
+        h = self.hash(keys)
+        sets = self._sets(h)
+        now = time.time()
+
+        rows = self.table[sets]
+        match = rows['key'] == h[:, None]
+        expired = match & (rows['expires'] < now)
+        match &= ~expired
+        # Slots written to while they were copied are treated as misses.
+        match &= self.table['key'][sets] == rows['key']
+
+        found = match.any(axis=1)
+        way = match.argmax(axis=1)
+        hit = rows[np.arange(len(keys)), way]
+        classes = np.where(found, hit['cls'], -1).astype(np.int64)
+        confidences = np.where(found, hit['confidence'], 0).astype(np.float32)
+        self.table['used'][sets[found], way[found]] = now
+
+        self.hits += int(found.sum())
+        self.misses += len(keys) - int(found.sum())
+        self.expirations += int(expired.any(axis=1).sum())
+        return classes, confidences, found
+
+    def put(self, keys, classes, confidences):
+        h = self.hash(keys)
+        sets = self._sets(h)
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else np.inf
+
+        for s, key, cls, confidence in zip(sets.tolist(), h, classes.tolist(), confidences.tolist()):
+            row = self.table[s]
+            same = np.flatnonzero(row['key'] == key)
+            if len(same):
+                way = same[0]
+            else:
+                # Empty and expired slots are reused first, the least recently used slot otherwise.
+                free = (row['key'] == 0) | (row['expires'] < now)
+                way = free.argmax() if free.any() else row['used'].argmin()
+                self.evictions += int(not free.any())
+
+            slot = self.table[s:s + 1, way]
+            slot['key'] = 0
+            slot['used'], slot['expires'], slot['cls'], slot['confidence'] = now, expires, cls, confidence
+            slot['key'] = key
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cache_size': int(np.count_nonzero(self.table['key'])),
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_evictions': self.evictions,
+            'cache_expirations': self.expirations,
+            'cache_hit_ratio': self.hits / lookups if lookups else 0.,
+        }
+
+    def close(self, unlink=False):
+        """
+        Detaches from the block, unlink removes it once all processes are detached (only for its creator).
+        """
+        del self.table
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class CachedScorer:
+
+    def __init__(self, scorer, cache):
+        """
+        Front-end of any scorer (Scorer, CascadeScorer, ...) that only scores domains missing in the cache
+        (ScoreCache or SharedScoreCache). Domains are cached under their normalized form, see normalize, and
+        repeated domains of a batch are scored once. The scorer has to score domains in their normalized form as
+        well (like serve.Scorer and serve.ProbaScorer), so that the cache does not change the results.
+        """
+        self.scorer = scorer
+        self.cache = cache
+        self.group_map = scorer.group_map
+
+    def score(self, domains):
+        """
+        Returns the class id and confidence of every domain like Scorer.score.
+        """
+        keys = [normalize(d) for d in domains]
+        classes, confidences, found = self.cache.get(keys)
+
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            unique, inverse = np.unique(np.array([keys[i] for i in missing], dtype=object), return_inverse=True)
+            unique_classes, unique_confidences = self.scorer.score(list(unique))
+            classes[missing], confidences[missing] = unique_classes[inverse], unique_confidences[inverse]
+            self.cache.put(list(unique), unique_classes, unique_confidences)
+
+        return classes, confidences
+
+    def stats(self):
+        return {**self.scorer.stats(), **self.cache.stats()}
@@ -0,0 +1,183 @@
+import os
+import copy
+import tempfile
+import importlib.util
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+import util
+import settings
+from bcos.bcosconv1d import BcosConv1d, freeze_weights, fold_scales
+from bcos.export import export_torchscript, export_onnx, Runner
+from bcos.resnet1d_bcos import ResNet
+from bcos.explain_bcos import explanation_mode, dynamic_linear_weights, explain_domains
+
+
+def reference_fwd_2(layer, in_tensor):
+    # BcosConv1d.fwd_2 before the fused norm and MaxOut computation
+    out = layer.linear(in_tensor)
+    if layer.max_out > 1:
+        bs, h, w = out.shape
+        out = out.view(bs, -1, layer.max_out, w)
+        out = out.max(dim=2, keepdim=False)[0]
+
+    norm = (F.avg_pool1d((in_tensor ** 2).sum(1, keepdim=True), layer.kernel_size, padding=layer.padding,
+                         stride=layer.stride) * layer.kssq + 1e-6
+            ).sqrt_()
+
+    if layer.detach:
+        out = (out * out.abs().detach())
+        norm = norm.detach()
+    else:
+        out = (out * out.abs())
+    return out / (norm * layer.scale)
+
+
+def reference_explain_domain(model, embedding, test_domain):
+    # explain_domain before batching: one forward and backward pass per domain
+    x, _ = util.encode_domains([test_domain], dtype=np.int64)
+    domain = embedding(torch.from_numpy(x).to(embedding.weight.device)).detach().requires_grad_(True)
+
+    pred = model(domain)
+    x = torch.argmax(pred[0])
+    cls = x.item()
+    cnf = torch.softmax(pred[0], dim=0)[x].item()
+
+    w, = torch.autograd.grad(pred[0][x], domain)
+
+    linearity = ((domain * w).sum() + model[-1].bias)
+    if linearity.shape != ():
+        linearity = linearity[x]
+
+    alignment = abs(pred[0][x].item() - linearity.item())
+
+    w_no_padding = torch.squeeze(w)[settings.maxlen - len(test_domain):]
+    x_no_padding = torch.squeeze(domain)[settings.maxlen - len(test_domain):]
+
+    con = x_no_padding * w_no_padding
+    con = torch.sum(con, dim=1)
+    con = torch.div(con, torch.max(torch.abs(con))).cpu().detach().tolist()
+
+    w_no_padding = torch.sum(w_no_padding, dim=1)
+    w_no_padding = torch.div(w_no_padding, torch.max(torch.abs(w_no_padding))).cpu().detach().tolist()
+
+    return w_no_padding, con, alignment, cls, cnf
+
+
+def random_domains(n, rng):
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789-"))
+    return ["".join(rng.choice(alphabet, rng.integers(3, 40))) + ".com" for _ in range(n)]
+
+
+def check_bcos_layer(layer, batch_size=8, length=64):
+    """
+    The fused BcosConv1d forward pass and its input gradient match reference_fwd_2, with and without detach.
+    """
+    x = torch.randn((batch_size, layer.inc, length))
+
+    for detach in [False, True]:
+        layer.explanation_mode(detach)
+        inp = x.clone().requires_grad_(True)
+        inp_reference = x.clone().requires_grad_(True)
+        out, out_reference = layer(inp), reference_fwd_2(layer, inp_reference)
+        assert torch.allclose(out, out_reference, rtol=1e-4, atol=1e-5)
+
+        grad, = torch.autograd.grad(out.sum(), inp)
+        grad_reference, = torch.autograd.grad(out_reference.sum(), inp_reference)
+        assert torch.allclose(grad, grad_reference, rtol=1e-4, atol=1e-5)
+    layer.explanation_mode(False)
+
+
+def check_inference_variants(model, x):
+    """
+    The model with frozen weights and the model with folded scales predict like the eager model.
+    """
+    frozen = copy.deepcopy(model)
+    freeze_weights(frozen)
+
+    with torch.no_grad():
+        expected = model(x)
+        for variant in [frozen, fold_scales(model)]:
+            assert torch.allclose(variant(x), expected, rtol=1e-4, atol=1e-4)
+
+
+def check_export(model, x):
+    """
+    The exported TorchScript (and ONNX, if onnxruntime is installed) runners predict like the eager model.
+    """
+    with torch.no_grad():
+        expected = model(x).numpy()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_torchscript(model, os.path.join(tmp, "model.pt"))
+        runners = [Runner(os.path.join(tmp, "model.pt"))]
+        if importlib.util.find_spec("onnxruntime") is not None:
+            export_onnx(model, os.path.join(tmp, "model.onnx"))
+            runners.append(Runner(os.path.join(tmp, "model.onnx"), num_threads=1))
+
+        for runner in runners:
+            assert np.allclose(runner(x.numpy()), expected, rtol=1e-4, atol=1e-4)
+
+
+def check_explanation_weights(model, embedding, x):
+    """
+    The closed-form dynamic-linear weights are the input gradients of the predicted class.
+    """
+    with torch.no_grad():
+        inp = embedding(x)
+
+    # The input gradients of the deep network are badly conditioned in float32, so compare in float64.
+    model64, inp64 = copy.deepcopy(model).double(), inp.double().requires_grad_(True)
+    pred = model64(inp64)
+    cls = torch.argmax(pred, dim=1)
+    w_autograd, = torch.autograd.grad(pred.gather(1, cls[:, None]).sum(), inp64)
+    w_closed_form = dynamic_linear_weights(model64, inp64.detach())[2]
+    assert torch.allclose(w_autograd, w_closed_form, rtol=1e-6, atol=1e-9 * w_autograd.abs().max().item())
+
+
+def check_explain_domains(model, embedding, domains, variants=({},)):
+    """
+    Batched explanations match the per-domain reference_explain_domain, for every keyword arguments of
+    explain_domains in variants.
+    """
+    reference = [reference_explain_domain(model, embedding, domain) for domain in domains]
+
+    for kwargs in variants:
+        explanations = explain_domains(model, embedding, domains, batch_size=4, **kwargs)
+        assert len(explanations) == len(domains)
+
+        for i, (w_ref, con_ref, alignment_ref, cls_ref, cnf_ref) in enumerate(reference):
+            w, con, alignment, cls, cnf = explanations[i]
+            assert cls == cls_ref and len(w) == len(w_ref) == len(con_ref)
+            assert np.allclose(w, w_ref, rtol=1e-4, atol=1e-4)
+            assert np.allclose(con, con_ref, rtol=1e-4, atol=1e-4)
+            assert np.isclose(cnf, cnf_ref, rtol=1e-4, atol=1e-5)
+            assert np.isclose(alignment, alignment_ref, rtol=1e-2, atol=1e-3)
+
+
+if __name__ == "__main__":
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    torch.set_num_threads(1)
+
+    for layer in [BcosConv1d(64, 64), BcosConv1d(64, 64, kernel_size=3, padding=1),
+                  BcosConv1d(64, 64, kernel_size=3, stride=2)]:
+        check_bcos_layer(layer)
+    print("BcosConv1d fused vs. reference: ok")
+
+    model = ResNet().eval()
+    x = torch.randint(1, settings.max_features, (4, settings.maxlen))
+    check_inference_variants(model, x)
+    print("frozen and folded vs. eager: ok")
+    check_export(model, x)
+    print("exported vs. eager: ok")
+
+    sequential = model.get_sequential_model()
+    explanation_mode(sequential)
+    check_explanation_weights(sequential[1:], sequential[0], x)
+    print("dynamic-linear vs. autograd weights: ok")
+
+    check_explain_domains(sequential[1:], sequential[0], random_domains(6, rng),
+                          variants=({}, {'dynamic_linear': True}))
+    print("batched and dynamic-linear vs. per-domain explanations: ok")
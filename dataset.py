@@ -0,0 +1,155 @@
+import os
+import pickle
+import hashlib
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+import util
+import settings
+
+DOMAINS_FILE = "domains.bin"
+OFFSETS_FILE = "offsets.npy"
+LABELS_FILE = "labels.npy"
+
+
+def convert(pkl_path=settings.DS_MODELS_PATH, path=settings.DS_MODELS_COLUMNAR_PATH):
+    """
+    Converts a pickled family -> domains dict once into the on-disk columnar format:
+    packed UTF-8 bytes, int64 offsets into these bytes and int16 labels (indices of settings.group_map).
+    """
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+
+    os.makedirs(path, exist_ok=True)
+
+    lengths = []
+    labels = []
+    with open(os.path.join(path, DOMAINS_FILE), 'wb') as f:
+        for cls in settings.group_map:
+            family = [d.encode('utf-8') for d in data[settings.group_map[cls]]]
+            f.write(b"".join(family))
+
+            lengths.append(np.fromiter(map(len, family), dtype=np.int64, count=len(family)))
+            labels.append(np.full(len(family), cls, dtype=np.int16))
+
+    offsets = np.concatenate(([0], np.cumsum(np.concatenate(lengths))))
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    np.save(os.path.join(path, LABELS_FILE), np.concatenate(labels))
+
+
+def load(pkl_path=settings.DS_MODELS_PATH, path=settings.DS_MODELS_COLUMNAR_PATH):
+    """
+    Opens the columnar dataset at path and (re-)converts it from pkl_path first if it is missing or outdated.
+    """
+    labels_path = os.path.join(path, LABELS_FILE)
+    if not os.path.exists(labels_path) or os.path.getmtime(labels_path) < os.path.getmtime(pkl_path):
+        convert(pkl_path, path)
+
+    return DomainDataset(path)
+
+
+class DomainDataset:
+
+    def __init__(self, path=settings.DS_MODELS_COLUMNAR_PATH):
+        """
+        Memory-mapped view on a dataset in the columnar format written by convert().
+        Domains are only decoded for the requested indices, the full list is never materialised.
+        """
+        self.path = path
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self.labels = np.load(os.path.join(path, LABELS_FILE), mmap_mode='r')
+
+        if self.offsets[-1] > 0:
+            self.buffer = np.memmap(os.path.join(path, DOMAINS_FILE), dtype=np.uint8, mode='r')
+        else:
+            self.buffer = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def domains(self, indices=None):
+        if indices is None:
+            indices = range(len(self))
+        return [self[i] for i in indices]
+
+    def chunks(self, indices=None, chunk_size=2 ** 16):
+        """
+        Yields (domains, labels) for consecutive chunks of at most chunk_size of the given indices.
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            yield self.domains(chunk), self.labels[chunk]
+
+    def fingerprint(self):
+        """
+        Content hash of the dataset files, used to key caches derived from this dataset.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for name in (DOMAINS_FILE, OFFSETS_FILE, LABELS_FILE):
+            with open(os.path.join(self.path, name), 'rb') as f:
+                for block in iter(lambda: f.read(2 ** 20), b""):
+                    h.update(block)
+        return h.hexdigest()
+
+    def split(self, n_splits=4, binary=False, shuffle=True, random_state=None):
+        """
+        Stratified k-fold split over the dataset. Stratifies on benign/malicious if binary is set.
+        With shuffle, the returned train and test indices are in random order like the previously permuted arrays.
+        """
+        labels = np.asarray(self.labels)
+        if binary:
+            labels = (labels != 0).astype(np.int16)
+
+        rng = np.random.default_rng(random_state)
+        kfold = StratifiedKFold(n_splits=n_splits, shuffle=shuffle, random_state=random_state if shuffle else None)
+
+        for train, test in kfold.split(labels, labels):
+            if shuffle:
+                train, test = rng.permutation(train), rng.permutation(test)
+            yield train, test
+
+
+def load_encoded(data, maxlen=settings.maxlen, valid_chars=settings.valid_chars,
+                 path=settings.DS_ENCODED_CACHE_PATH, chunk_size=2 ** 16):
+    """
+    Returns the (N, maxlen) uint8 index matrix of all domains in data and the mask of valid domains,
+    both memory-mapped. The matrix is computed in a single pass and cached on disk, keyed by the dataset
+    fingerprint and the encoding configuration. Rows of invalid domains are all zero.
+    Folds select their rows directly, e.g. train = train[valid[train]] and x[train], data.labels[train].
+    """
+    config = repr((sorted(valid_chars.items()), maxlen)).encode()
+    key = hashlib.blake2b(data.fingerprint().encode() + config, digest_size=16).hexdigest()
+
+    x_path = os.path.join(path, f"{key}.x.npy")
+    valid_path = os.path.join(path, f"{key}.valid.npy")
+
+    if not os.path.exists(x_path) or not os.path.exists(valid_path):
+        os.makedirs(path, exist_ok=True)
+        table = util._build_char_table(valid_chars)
+
+        x = np.lib.format.open_memmap(x_path + ".tmp", mode='w+', dtype=np.uint8, shape=(len(data), maxlen))
+        valid = np.zeros(len(data), dtype=bool)
+
+        for start in range(0, len(data), chunk_size):
+            end = min(start + chunk_size, len(data))
+            offsets = np.asarray(data.offsets[start:end + 1])
+
+            encoded, valid[start:end] = util.encode_bytes(data.buffer[offsets[0]:offsets[-1]], np.diff(offsets),
+                                                          maxlen=maxlen, dtype=np.uint8, table=table)
+            x[start:end][valid[start:end]] = encoded
+
+        x.flush()
+        del x
+        np.save(valid_path + ".tmp.npy", valid)
+
+        # Publish the cache only once it is complete.
+        os.replace(x_path + ".tmp", x_path)
+        os.replace(valid_path + ".tmp.npy", valid_path)
+
+    return np.load(x_path, mmap_mode='r'), np.load(valid_path, mmap_mode='r')
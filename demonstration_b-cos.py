@@ -1,40 +1,28 @@
 import gc
-import pickle
 import numpy as np
-from sklearn.model_selection import StratifiedKFold
 
 import torch
 import torch.nn as nn
 from torchsample.modules import ModuleTrainer
 from bcos.losses import LogitsBCE
 from bcos.resnet1d_bcos import ResNet as bcos
+from bcos.device import select_device, empty_cache
 
 import util
+import artifacts
+import dataset
 import settings
 
 if __name__ == "__main__":
     nb_epochs = 1
+    device = select_device()
 
-    with open(settings.DS_MODELS_PATH, 'rb') as f:
-        data = pickle.load(f)
+    data = dataset.load(settings.DS_MODELS_PATH)
+    train_test = data.split(n_splits=4, random_state=settings.split_random_state)
 
-    domains = []
-    labels = []
-    classes = ['benign'] + sorted([x for x in data if x != 'benign'])
+    for fold, (train, test) in enumerate(train_test):
 
-    for cls in settings.group_map:
-        domains += data[settings.group_map[cls]]
-        labels += [cls] * len(data[settings.group_map[cls]])
-
-    idx = np.random.permutation(len(domains))
-    domains, labels = np.array(domains)[idx], np.array(labels)[idx]
-
-    kfold = StratifiedKFold(n_splits=4, shuffle=True)
-    train_test = kfold.split(domains, labels)
-
-    for train, test in train_test:
-
-        x_train, y_train = util.preprocess_data(domains[train], labels[train], binary=False)
+        x_train, y_train, _ = util.preprocess_data(data.domains(train), data.labels[train], binary=False)
 
         class_weights = []
         for g in sorted(list(set(y_train))):
@@ -42,13 +30,13 @@ if __name__ == "__main__":
                 len(y_train) / float(len([y_train[i] for i in range(len(y_train)) if y_train[i] == g])),
                 settings.class_weighting_power)
             class_weights.append(score)
-        class_weights = torch.tensor(class_weights, dtype=torch.float).cuda()
+        class_weights = torch.tensor(class_weights, dtype=torch.float, device=device)
 
-        x_train = torch.from_numpy(x_train).cuda()
-        y_train = torch.from_numpy(y_train).cuda()
-        y_train = nn.functional.one_hot(y_train.to(torch.int64)).float().cuda()
+        x_train = torch.from_numpy(x_train).to(device)
+        y_train = torch.tensor(y_train, device=device)
+        y_train = nn.functional.one_hot(y_train.to(torch.int64)).float()
 
-        model = bcos().cuda()
+        model = bcos().to(device)
         trainer = ModuleTrainer(model)
         criterion = LogitsBCE(weight=class_weights)
         trainer.compile(loss=criterion, optimizer='adam')
@@ -63,12 +51,15 @@ if __name__ == "__main__":
         test_labels = [0, 1]
         x_test, y_test, _ = util.preprocess_data(test_domains, test_labels, binary=False)
 
-        x_test = torch.from_numpy(x_test).cuda()
+        x_test = torch.from_numpy(x_test).to(device)
 
         preds = model(x_test)
         print(preds)
 
+        artifacts.save(model, f"{settings.ARTIFACTS_PATH}b-cos_fold{fold}", 'b-cos',
+                       split=artifacts.split_parameters(fold))
+
         model.cpu()
         del model
         gc.collect()
-        torch.cuda.empty_cache()
+        empty_cache(device)
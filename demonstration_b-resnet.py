@@ -1,41 +1,26 @@
-import pickle
-import numpy as np
 from tensorflow.keras import backend
-from sklearn.model_selection import StratifiedKFold
 
 import util
+import artifacts
+import dataset
+import pipeline
 import settings
 from models import resnet_binary
 
 if __name__ == "__main__":
     nb_epochs = 1
 
-    with open(settings.DS_MODELS_PATH, 'rb') as f:
-        data = pickle.load(f)
+    data = dataset.load(settings.DS_MODELS_PATH)
+    x, valid = dataset.load_encoded(data)
+    train_test = data.split(n_splits=4, binary=True, random_state=settings.split_random_state)
 
-    domains = []
-    labels = []
-    classes = ['benign'] + sorted([x for x in data if x != 'benign'])
-
-    for cls in classes:
-        domains += data[cls]
-        if cls == "benign":
-            labels += [0] * len(data[cls])
-        else:
-            labels += [1] * len(data[cls])
-
-    idx = np.random.permutation(len(domains))
-    domains, labels = np.array(domains)[idx], np.array(labels)[idx]
-
-    kfold = StratifiedKFold(n_splits=4, shuffle=True)
-    train_test = kfold.split(domains, labels)
-
-    for train, test in train_test:
+    for fold, (train, test) in enumerate(train_test):
         model, model_name = resnet_binary.build_model()
 
-        x_train, y_train, _ = util.preprocess_data(domains[train], labels[train], binary=True)
+        train = train[valid[train]]
+        train_ds = pipeline.from_encoded(x, data.labels, train, binary=True, batch_size=128)
 
-        model.fit(x_train, y_train, batch_size=128, epochs=nb_epochs)
+        model.fit(train_ds, epochs=nb_epochs)
 
         test_domains = ["nx-domain.org", "xxd80f04e0.kz"]
         test_labels = [0, 1]
@@ -43,4 +28,7 @@ if __name__ == "__main__":
         probs = model.predict(x_test)
         print(probs)
 
+        artifacts.save(model, f"{settings.ARTIFACTS_PATH}{model_name}_fold{fold}", 'b-resnet',
+                       split=artifacts.split_parameters(fold, binary=True))
+
         backend.clear_session()
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from tensorflow.keras import backend
+
+import artifacts
+import dataset
+import pipeline
+import settings
+import distillation
+from models import resnet_multiclass, resnet_multiclass_student
+
+if __name__ == "__main__":
+    nb_epochs = 1
+    bucketed = True
+    temperature = 4.
+    alpha = 0.1
+
+    data = dataset.load(settings.DS_MODELS_PATH)
+    x, valid = dataset.load_encoded(data)
+    lengths = np.minimum(np.diff(data.offsets), settings.maxlen) if bucketed else None
+    train_test = data.split(n_splits=4, random_state=settings.split_random_state)
+
+    for fold, (train, test) in enumerate(train_test):
+        train, test = train[valid[train]], test[valid[test]]
+        split = artifacts.split_parameters(fold)
+
+        # The teacher of the fold is reused if demonstration_m-resnet.py saved it for the same split, it is trained
+        # otherwise. A teacher of another split has seen test rows of this fold and would leak them into the student.
+        teacher_path = f"{settings.ARTIFACTS_PATH}{resnet_multiclass.MODEL_NAME}_fold{fold}"
+        if os.path.exists(os.path.join(teacher_path, artifacts.METADATA_FILE)) \
+                and artifacts.load_metadata(teacher_path).get('split') == split:
+            teacher = artifacts.load_model(teacher_path)
+        else:
+            teacher, _ = resnet_multiclass.build_model(variable_length=bucketed)
+            teacher.fit(pipeline.from_encoded(x, data.labels, train, nb_classes=settings.nb_classes, lengths=lengths,
+                                              batch_size=256), epochs=nb_epochs)
+
+        # A saved fixed-width teacher predicts at the full width, only variable-length models take the buckets.
+        teacher_lengths = lengths if teacher.inputs[0].shape[1] is None else None
+        soft = distillation.soft_targets(teacher, x, train, temperature, teacher_lengths)
+
+        student, model_name = resnet_multiclass_student.build_model(variable_length=bucketed)
+        distiller = distillation.build_distiller(student, temperature, alpha)
+        distiller.fit(pipeline.from_soft_targets(x, data.labels, train, soft, lengths=lengths, batch_size=256),
+                      epochs=nb_epochs)
+
+        for name, model, model_lengths in [("teacher", teacher, teacher_lengths), ("student", student, lengths)]:
+            macro_f1, throughput = distillation.evaluate(model, x, test, data.labels, model_lengths)
+            print(f"fold {fold} {name:<8s} params={model.count_params():<9d} macro-F1={macro_f1:.4f} "
+                  f"{throughput:.0f} domains/s")
+
+        artifacts.save(student, f"{settings.ARTIFACTS_PATH}{model_name}_fold{fold}", 'm-resnet_student', split=split)
+
+        del soft
+        backend.clear_session()
@@ -1,43 +1,41 @@
-import pickle
 import numpy as np
 from tensorflow.keras import backend
-from sklearn.model_selection import StratifiedKFold
 
 import util
+import artifacts
+import dataset
+import pipeline
 import settings
 from models import resnet_multiclass
 
 if __name__ == "__main__":
     nb_epochs = 1
+    bucketed = True
 
-    with open(settings.DS_MODELS_PATH, 'rb') as f:
-        data = pickle.load(f)
+    data = dataset.load(settings.DS_MODELS_PATH)
+    x, valid = dataset.load_encoded(data)
+    lengths = np.minimum(np.diff(data.offsets), settings.maxlen) if bucketed else None
+    train_test = data.split(n_splits=4, random_state=settings.split_random_state)
 
-    domains = []
-    labels = []
-    classes = ['benign'] + sorted([x for x in data if x != 'benign'])
+    for fold, (train, test) in enumerate(train_test):
+        model, model_name = resnet_multiclass.build_model(variable_length=bucketed)
 
-    for cls in settings.group_map:
-        domains += data[settings.group_map[cls]]
-        labels += [cls] * len(data[settings.group_map[cls]])
+        train = train[valid[train]]
+        train_ds = pipeline.from_encoded(x, data.labels, train, nb_classes=settings.nb_classes, lengths=lengths,
+                                         batch_size=256)
 
-    idx = np.random.permutation(len(domains))
-    domains, labels = np.array(domains)[idx], np.array(labels)[idx]
-
-    kfold = StratifiedKFold(n_splits=4, shuffle=True)
-    train_test = kfold.split(domains, labels)
-
-    for train, test in train_test:
-        model, model_name = resnet_multiclass.build_model()
-
-        x_train, y_train, _ = util.preprocess_data(domains[train], labels[train], binary=False)
-
-        model.fit(x_train, y_train, batch_size=256, epochs=nb_epochs)
+        model.fit(train_ds, epochs=nb_epochs)
 
         test_domains = ["nx-domain.org", "xxd80f04e0.kz"]
         test_labels = [0, 1]
-        x_test, y_test, _ = util.preprocess_data(test_domains, test_labels, binary=False)
-        preds = model.predict(x_test)
+        x_test, y_test, test_domains = util.preprocess_data(test_domains, test_labels, binary=False)
+        if bucketed:
+            preds = util.predict_bucketed(model.predict, x_test, [len(d) for d in test_domains])
+        else:
+            preds = model.predict(x_test)
         print(preds)
 
+        artifacts.save(model, f"{settings.ARTIFACTS_PATH}{model_name}_fold{fold}", 'm-resnet',
+                       split=artifacts.split_parameters(fold))
+
         backend.clear_session()
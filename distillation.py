@@ -0,0 +1,78 @@
+import time
+import numpy as np
+from sklearn.metrics import f1_score
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Activation, Rescaling
+
+import util
+
+
+def logits_model(model):
+    """
+    The model without its final softmax activation, i.e. mapping domains to logits.
+    """
+    return Model(model.inputs, model.layers[-2].output)
+
+
+def predict(model, x, rows, lengths=None, batch_size=1024, chunk_size=2 ** 16):
+    """
+    Predictions of a single-input Keras model for np.sort(rows) of the memory-mapped index matrix x, chunk by chunk.
+    With lengths, the rows are padded to the length buckets (see util.predict_bucketed), which needs a
+    variable-length model (input width None). Without, the rows are predicted at the full width of x.
+    """
+    if lengths is not None and model.inputs[0].shape[1] is not None:
+        raise ValueError(f"lengths given but the model has the fixed input width {model.inputs[0].shape[1]}, "
+                         f"only variable-length models can predict length buckets")
+
+    def predict_batches(batch):
+        return np.concatenate([np.asarray(model.predict_on_batch(batch[start:start + batch_size]))
+                               for start in range(0, len(batch), batch_size)])
+
+    # Sorted once over all rows, so that the predictions are in the order of np.sort(rows) for any chunk_size.
+    rows = np.sort(rows)
+    out = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if lengths is not None:
+            out.append(util.predict_bucketed(predict_batches, np.asarray(x[chunk]), lengths[chunk]))
+        else:
+            out.append(predict_batches(np.asarray(x[chunk])))
+    return np.concatenate(out)
+
+
+def soft_targets(teacher, x, rows, temperature=4., lengths=None, dtype=np.float16):
+    """
+    Temperature-softened class probabilities of the teacher for np.sort(rows), stored as dtype to save memory.
+    """
+    logits = predict(logits_model(teacher), x, np.sort(rows), lengths) / temperature
+    probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return (probabilities / probabilities.sum(axis=1, keepdims=True)).astype(dtype)
+
+
+def build_distiller(student, temperature=4., alpha=0.1):
+    """
+    Training model of the student for pipeline.from_soft_targets: its first output is trained on the labels with
+    weight alpha, its second output, the student probabilities at the given temperature, on the soft targets of the
+    teacher with weight (1 - alpha) * temperature^2 (Hinton et al., Distilling the Knowledge in a Neural Network).
+    The layers are shared with student, which stays the model used for inference.
+    """
+    logits = student.layers[-2].output
+    soft = Activation('softmax', name='soft')(Rescaling(1 / temperature)(logits))
+
+    distiller = Model(student.inputs, [student.outputs[0], soft])
+    distiller.compile(loss=['categorical_crossentropy', 'kl_divergence'],
+                      loss_weights=[alpha, (1 - alpha) * temperature ** 2], optimizer='adam')
+    return distiller
+
+
+def evaluate(model, x, rows, labels, lengths=None):
+    """
+    Returns: Macro-F1 of the model on the rows and its throughput in domains/s.
+    """
+    rows = np.sort(rows)
+    start = time.perf_counter()
+    pred = predict(model, x, rows, lengths)
+    throughput = len(rows) / (time.perf_counter() - start)
+
+    y = np.asarray(labels[rows])
+    return f1_score(y, pred.argmax(axis=1), average='macro'), throughput
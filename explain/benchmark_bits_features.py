@@ -0,0 +1,43 @@
+import time
+import argparse
+import numpy as np
+
+from explain.misc.data import CompatibilityDataSet
+from explain.base.features.examples import statistical
+from explain.base.features.examples.utility import JoinedSubdomainsBitArray
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-sample vs. batch evaluation of the zlib ratio and bits entropy.")
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--n-jobs', type=int, default=4)
+    args = parser.parse_args()
+
+    dataset = CompatibilityDataSet.load("../datasets/models.pkl")
+    X, _ = dataset.expand()
+    rng = np.random.default_rng(0)
+    samples = [X[i] for i in rng.choice(len(X), min(args.samples, len(X)), replace=False)]
+    # Domains without subdomains give empty bit sequences.
+    samples += ['com', 'example.com', 'example.co.uk']
+
+    start = time.perf_counter()
+    ratios = np.array([statistical.ZlibBitsCompressionRatio.evaluate(sample) for sample in samples])
+    entropies = np.array([statistical.BitsEntropy.evaluate(sample) for sample in samples])
+    per_sample_time = time.perf_counter() - start
+
+    # Empty, all-zero and one-hot sequences like the per-sample feature: entropy 0, nan and 0.
+    edge_cases = statistical.bits_entropies(*statistical.pack_bit_arrays([np.zeros(0, dtype=np.int64),
+                                                                          np.zeros(9, dtype=np.int64),
+                                                                          np.eye(1, 9, 4, dtype=np.int64)[0]]))
+    assert np.allclose(edge_cases, [0., np.nan, 0.], equal_nan=True)
+
+    packed, lengths = statistical.pack_bit_arrays([JoinedSubdomainsBitArray.evaluate(sample) for sample in samples])
+    for n_jobs in sorted({1, args.n_jobs}):
+        start = time.perf_counter()
+        batch_ratios = statistical.zlib_bits_compression_ratios(packed, lengths, n_jobs)
+        batch_entropies = statistical.bits_entropies(packed, lengths)
+        batch_time = time.perf_counter() - start
+
+        assert np.array_equal(batch_ratios, ratios)
+        assert np.allclose(batch_entropies, entropies, rtol=1e-12, equal_nan=True)
+        print(f"n_jobs={n_jobs}: per-sample {len(samples) / per_sample_time:9.0f} domains/s "
+              f"batch {len(samples) / batch_time:9.0f} domains/s")
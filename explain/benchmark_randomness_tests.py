@@ -0,0 +1,36 @@
+import time
+import argparse
+import numpy as np
+
+from explain.misc.data import CompatibilityDataSet
+from explain.base.features.examples import statistical
+from explain.base.features.examples.utility import JoinedSubdomainsBitArray, JoinedSubdomainsUnicodeBitarray
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-sample vs. batch evaluation of the randomness tests.")
+    parser.add_argument('--samples', type=int, default=10000)
+    args = parser.parse_args()
+
+    dataset = CompatibilityDataSet.load("../datasets/models.pkl")
+    X, _ = dataset.expand()
+    rng = np.random.default_rng(0)
+    samples = [X[i] for i in rng.choice(len(X), min(args.samples, len(X)), replace=False)]
+
+    for bitarray in [JoinedSubdomainsBitArray, JoinedSubdomainsUnicodeBitarray]:
+        bit_arrays = [bitarray.evaluate(sample) for sample in samples]
+        bits, lengths = statistical.pad_bit_arrays(bit_arrays)
+        print(f"{bitarray.name}: {len(samples)} domains, {lengths.mean():.0f} bits on average")
+
+        for test, per_sample in statistical.TEST_MAPPING.items():
+            start = time.perf_counter()
+            with np.errstate(all='ignore'):
+                expected = np.array([per_sample(b) for b in bit_arrays], dtype=np.float64)
+            per_sample_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            p_values = statistical.randomness_test_pvalues(bits, lengths, tests=[test])[:, 0]
+            batch_time = time.perf_counter() - start
+
+            assert np.allclose(p_values, expected, rtol=1e-9, atol=0, equal_nan=True), test
+            print(f"  {test:<20s} per-sample {len(samples) / per_sample_time:9.0f} domains/s "
+                  f"batch {len(samples) / batch_time:9.0f} domains/s")
@@ -3,6 +3,8 @@ Example Statistical Features
 ----------------------------
 """
 import math
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 import zlib
 
@@ -20,7 +22,16 @@ __all__ = [
     'BitsEntropy',
     'NgramStatisticalFunctions',
     'RandomnessTests',
-    'ZlibBitsCompressionRatio'
+    'ZlibBitsCompressionRatio',
+    'bits_entropies',
+    'evaluate_bits_features',
+    'evaluate_ngram_statistics',
+    'evaluate_randomness_tests',
+    'ngram_statistics',
+    'pack_bit_arrays',
+    'pad_bit_arrays',
+    'randomness_test_pvalues',
+    'zlib_bits_compression_ratios'
 ]
 
 
@@ -167,6 +178,144 @@ Examples
 """
 
 
+def _ngram_moments(counts):
+    # power sums of the n-gram counts of every domain, computed once for all statistics
+    sizes = np.fromiter((np.size(c) for c in counts), dtype=np.int64, count=len(counts))
+    values = np.concatenate([np.ravel(c) for c in counts] + [[]]).astype(np.int64)
+    rows = np.repeat(np.arange(len(counts)), sizes)
+
+    def power_sum(weights):
+        return np.bincount(rows, weights, minlength=len(counts))
+
+    moments = {
+        'count': sizes,
+        'sum': power_sum(values),
+        'sum_2': power_sum(values ** 2),
+        'sum_3': power_sum(values ** 3),
+        'sum_4': power_sum(values ** 4),
+        'sum_reciprocal': power_sum(1 / np.maximum(values, 1)),
+        'sum_x_log_x': power_sum(values * np.log(np.maximum(values, 1))),
+    }
+    return moments, values, rows
+
+
+def _ngram_central_moments(moments):
+    # The counts are integers, so m^k times the k-th central moment sum is an exact integer polynomial of the power
+    # sums. int64 holds it while the counts of a domain sum up to less than 512, longer than any DNS name.
+    m, s_1, s_2, s_3, s_4 = (moments[key] for key in ['count', 'sum', 'sum_2', 'sum_3', 'sum_4'])
+    dtype = np.int64 if s_1.max(initial=0) < 512 else np.float64
+    m, s_1, s_2, s_3, s_4 = (np.rint(x).astype(dtype) for x in [m, s_1, s_2, s_3, s_4])
+
+    m_2 = (m * s_2 - s_1 ** 2) / m ** 2
+    m_3 = (m ** 2 * s_3 - 3 * m * s_1 * s_2 + 2 * s_1 ** 3) / m ** 3
+    m_4 = (m ** 3 * s_4 - 4 * m ** 2 * s_1 * s_3 + 6 * m * s_1 ** 2 * s_2 - 3 * s_1 ** 4) / m ** 4
+    return m_2, m_3, m_4
+
+
+def _ngram_percentiles(values, rows, sizes, qs):
+    # linear interpolation between the closest ranks like np.percentile, on the counts sorted within every domain
+    sorted_values = values[np.lexsort((values, rows))].astype(np.float64)
+    starts = np.cumsum(sizes) - sizes
+    last = np.maximum(sizes - 1, 0)
+
+    percentiles = []
+    for q in qs:
+        position = q / 100 * last
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, last)
+        lower = sorted_values[np.minimum(starts + below, len(sorted_values) - 1)] if len(sorted_values) else 0.
+        upper = sorted_values[np.minimum(starts + above, len(sorted_values) - 1)] if len(sorted_values) else 0.
+        percentiles.append(np.where(sizes > 0, lower + (upper - lower) * (position - below), np.nan))
+    return percentiles
+
+
+def ngram_statistics(counts, subdomains_lengths, n, statistics=tuple(NGRAM_FUNCTIONS)):
+    """Evaluates statistical functions of :py:data:`NgramStatisticalFunctions` for a batch of n-gram counts at once.
+
+    All statistics are derived from the same power sums of the counts (count, sum of x, x^2, x^3, x^4, 1/x and
+    x log x), quantiles from one sort of all counts. As for the single features, short domains (joined subdomains
+    shorter than n) get 0 for statistics that are undefined for them.
+
+    Parameters
+    ----------
+    counts : list of np.ndarray
+        n-gram sequence counts of every domain, e.g. evaluations of the n-gram feature of
+        :py:data:`.JoinedSubdomainsNGrams`.
+    subdomains_lengths : np.ndarray
+        Evaluations of :py:data:`.SubdomainsLength` of the domains.
+    n : int
+        Length of the n-grams.
+    statistics : sequence of str
+        Statistical functions as in :py:data:`NGRAM_FUNCTIONS`.
+
+    Returns
+    -------
+    np.ndarray
+        (N, len(statistics)) matrix with one column per statistical function.
+    """
+    moments, values, rows = _ngram_moments(counts)
+    size, total = moments['count'], moments['sum']
+    results = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / size
+        if {'kurtosis', 'skewness', 'standard-deviation'} & set(statistics):
+            m_2, m_3, m_4 = _ngram_central_moments(moments)
+            # constant counts have a skewness of 0 and a kurtosis of -3 as in scipy.stats
+            results['kurtosis'] = np.where(m_2 == 0, 0, m_4 / m_2 ** 2) - 3
+            results['skewness'] = np.where(m_2 == 0, 0, m_3 / m_2 ** 1.5)
+            results['standard-deviation'] = np.sqrt(m_2)
+        if {'lower-quartile', 'median', 'upper-quartile', 'min', 'max'} & set(statistics):
+            results['min'], results['lower-quartile'], results['median'], results['upper-quartile'], results['max'] = \
+                _ngram_percentiles(values, rows, size, [0, 25, 50, 75, 100])
+
+        results['alphabet-diversity'] = size / total
+        results['alphabet-size'] = size.astype(np.float64)
+        results['arithmetic-mean'] = mean
+        results['harmonic-mean'] = size / moments['sum_reciprocal']
+        results['shannon-entropy'] = (np.log(total) - moments['sum_x_log_x'] / total) / np.log(2)
+
+    out = np.stack([results[statistic] for statistic in statistics], axis=1)
+    short = np.asarray(subdomains_lengths) < n
+    out[short] = np.where(np.isfinite(out[short]), out[short], 0)
+    return out
+
+
+def evaluate_ngram_statistics(samples, names=None):
+    """Evaluates features of :py:data:`NgramStatisticalFunctions` for a batch of samples.
+
+    The n-grams and the subdomains length of every sample are evaluated once for all requested features, the
+    statistics by :py:func:`ngram_statistics`.
+
+    Parameters
+    ----------
+    samples : list of str
+        Domains to evaluate.
+    names : sequence of str
+        Identifiers of the features, e.g. '2-gram-shannon-entropy', all 39 features if None.
+
+    Returns
+    -------
+    np.ndarray
+        (N, len(names)) matrix with one column per feature.
+    """
+    ngram_features = JoinedSubdomainsNGrams.unpack()
+    if names is None:
+        names = [f'{ngram_feature.name[0]}-gram-{stat_name}'
+                 for ngram_feature in ngram_features for stat_name in NGRAM_FUNCTIONS]
+
+    subdomains_lengths = np.array([linguistic.SubdomainsLength.evaluate(sample) for sample in samples])
+    out = np.empty((len(samples), len(names)))
+    for ngram_feature in ngram_features:
+        prefix = f'{ngram_feature.name[0]}-gram-'
+        columns = [i for i, name in enumerate(names) if name.startswith(prefix)]
+        if columns:
+            counts = [ngram_feature.evaluate(sample) for sample in samples]
+            out[:, columns] = ngram_statistics(counts, subdomains_lengths, ngram_feature.n,
+                                               [names[i][len(prefix):] for i in columns])
+    return out
+
+
 def _probabilities(rank):
     p_full = np.prod([
         1 - pow(2, k - rank)
@@ -189,7 +338,45 @@ BINARY_MATRIX_RANK_TEST_PROBABILITIES = {
 }
 
 
-def _binary_matrix_rank_test(bits):
+def _gf2_ranks(matrices):
+    # ranks over GF(2) of a stack of 0/1 matrices, Gaussian elimination on the rows packed into uint64 words
+    nb_matrices, nb_rows, nb_columns = matrices.shape
+    words = np.bitwise_or.reduce(matrices.astype(np.uint64) << np.arange(nb_columns, dtype=np.uint64), axis=2)
+
+    index = np.arange(nb_matrices)
+    pivots = np.zeros((nb_matrices, nb_rows), dtype=bool)
+    ranks = np.zeros(nb_matrices, dtype=np.int64)
+    for column in range(nb_columns):
+        has_bit = (words & np.uint64(1 << column)) != 0
+        candidates = has_bit & ~pivots
+        found = candidates.any(axis=1)
+        pivot = candidates.argmax(axis=1)
+
+        # clear the column in all other rows by adding the pivot row
+        pivot_words = words[index, pivot]
+        has_bit[index, pivot] = False
+        words ^= np.where(has_bit & found[:, None], pivot_words[:, None], np.uint64(0))
+
+        pivots[index[found], pivot[found]] = True
+        ranks += found
+
+    return ranks
+
+
+def _binary_matrix_ranks(matrices, gf2=False):
+    ranks = _gf2_ranks(matrices)
+    if gf2:
+        return ranks
+
+    # Compatibility with the real-valued rank the published models were trained with: it is at least the rank over
+    # GF(2) (an odd minor is non-zero) and equal for 2x2 matrices, so only the deficient larger matrices need an SVD.
+    deficient = np.flatnonzero(ranks < matrices.shape[1])
+    if matrices.shape[1] > 2 and len(deficient):
+        ranks[deficient] = np.linalg.matrix_rank(matrices[deficient])
+    return ranks
+
+
+def _binary_matrix_rank_test(bits, gf2=False):
     highest_dimension = max(int(np.sqrt(bits.size / 38)), 2)
 
     # We are bound by the number of bits the subdomains consist of
@@ -210,7 +397,8 @@ def _binary_matrix_rank_test(bits):
 
     for block in blocks:
         matrix = block.reshape((dimension, dimension))
-        rank = np.linalg.matrix_rank(matrix)
+        # NIST SP 800-22 defines the test on the rank over GF(2), the features of the published models use the real rank
+        rank = _gf2_ranks(matrix[np.newaxis])[0] if gf2 else np.linalg.matrix_rank(matrix)
 
         if rank == dimension:
             full_rank_matrices += 1
@@ -262,25 +450,35 @@ def _block_frequency_test(bits):
 
 
 def _cusum_test_statistic(bits):
-    z = bits[0]
-    S_i = 0
+    S = np.cumsum(2 * bits.astype(np.int64) - 1)
 
-    for i in range(bits.size):
-        S_i += 2 * bits[i] - 1
-        z = max(z, abs(S_i))
+    return max(bits[0], np.abs(S).max())
 
-    return z
 
+def _batch_cusum_test_pvalue(n, z):
+    # p-values for arrays of bit lengths n and statistics z, terms of the sums beyond their last k are masked with 0
+    n = np.asarray(n, dtype=np.int64)
+    z = np.asarray(z, dtype=np.int64)
+    sqrt_n = np.sqrt(n)
+    k_last = np.trunc((n / z - 1) * 0.25).astype(np.int64)
 
-def _cusum_test_pvalue(n, z):
-    sum_1 = sum(scipy.stats.norm.cdf(((4 * k + 1) * z) / np.sqrt(n)) - scipy.stats.norm.cdf(((4 * k - 1) * z) / np.sqrt(n))
-                for k
-                in range(int((-n / z + 1) * 0.25), 1 + int((n / z - 1) * 0.25)))
-    sum_2 = sum(scipy.stats.norm.cdf(((4 * k + 3) * z) / np.sqrt(n)) - scipy.stats.norm.cdf(((4 * k + 1) * z) / np.sqrt(n))
-                for k
-                in range(int((-n / z - 3) * 0.25), 1 + int((n / z - 1) * 0.25)))
+    sums = []
+    for k_first, upper, lower in [(np.trunc((-n / z + 1) * 0.25), 1, -1), (np.trunc((-n / z - 3) * 0.25), 3, 1)]:
+        k_first = k_first.astype(np.int64)
+        total = np.zeros(n.shape)
+        for offset in range(int(np.max(k_last - k_first, initial=-1)) + 1):
+            k = k_first + offset
+            term = sp.special.ndtr(((4 * k + upper) * z) / sqrt_n) - sp.special.ndtr(((4 * k + lower) * z) / sqrt_n)
+            total = total + np.where(k <= k_last, term, 0)
+        sums.append(total)
+
+    return 1 - sums[0] + sums[1]
 
-    return 1 - sum_1 + sum_2
+
+@functools.lru_cache(maxsize=2 ** 16)
+def _cusum_test_pvalue(n, z):
+    # n and z are bounded by the bit length of the domains, so few distinct pairs recur over a dataset
+    return _batch_cusum_test_pvalue(n, z)[()]
 
 
 def _double_cusum_test(bits):
@@ -297,9 +495,7 @@ def _double_cusum_test(bits):
     # return forward_pvalue >= 0.01 and backward_pvalue >= 0.01
 
 
-def _longest_run_of_ones_test(bits):
-    n = bits.size
-
+def _longest_run_parameters(n):
     # TODO: decide what to do with (too) short bit streams
     if n < 128:
         # Try experimental M, N
@@ -324,6 +520,13 @@ def _longest_run_of_ones_test(bits):
         V = [10, 11, 12, 13, 14, 15, 16]
         pi = [0.0882, 0.2092, 0.2483, 0.1933, 0.1208, 0.0675, 0.0727]
 
+    return K, M, V, pi
+
+
+def _longest_run_of_ones_test(bits):
+    n = bits.size
+    K, M, V, pi = _longest_run_parameters(n)
+
     splits = list(range(M, bits.size, M))
     discard = bits.size % M
 
@@ -420,6 +623,244 @@ TEST_MAPPING = {
     'spectral':            _spectral_test
 }
 
+# Batch versions of the randomness tests: bits is a (N, L) matrix of N bit sequences, row i holding lengths[i] bits
+# followed by padding, see pad_bit_arrays. They return the p-values of the per-sample versions as an (N,) array.
+
+def _batch_blocks(bits, lengths, block_size):
+    # (N, max number of blocks, block_size) view of the complete blocks and the mask of the blocks within lengths
+    nb_blocks = lengths // block_size
+    width = int(nb_blocks.max(initial=0)) * block_size
+    blocks = bits[:, :width].reshape(len(bits), -1, block_size)
+    return blocks, np.arange(blocks.shape[1]) < nb_blocks[:, None]
+
+
+def _batch_binary_matrix_rank_test(bits, lengths, gf2=False):
+    p_values = np.empty(len(bits))
+    dimensions = np.minimum(np.maximum(np.sqrt(lengths / 38).astype(np.int64), 2), 32)
+
+    for dimension in np.unique(dimensions):
+        rows = np.flatnonzero(dimensions == dimension)
+        blocks, in_length = _batch_blocks(bits[rows], lengths[rows], dimension * dimension)
+
+        ranks = _binary_matrix_ranks(blocks[in_length].reshape(-1, dimension, dimension), gf2)
+        row_ids = np.repeat(np.arange(len(rows)), in_length.sum(axis=1))
+        N = np.bincount(row_ids, minlength=len(rows))
+        full_rank_matrices = np.bincount(row_ids, ranks == dimension, minlength=len(rows))
+        near_full_rank_matrices = np.bincount(row_ids, ranks == dimension - 1, minlength=len(rows))
+        remaining_matrices = N - full_rank_matrices - near_full_rank_matrices
+
+        p_full, p_near_full, p_remaining = BINARY_MATRIX_RANK_TEST_PROBABILITIES[dimension]
+        N_full_expected = N * p_full
+        N_near_full_expected = N * p_near_full
+        N_remaining_expected = N * p_remaining
+
+        chisq = ((full_rank_matrices - N_full_expected) ** 2) / N_full_expected + \
+                ((near_full_rank_matrices - N_near_full_expected) ** 2) / N_near_full_expected + \
+                ((remaining_matrices - N_remaining_expected) ** 2) / N_remaining_expected
+        p_values[rows] = np.exp(-chisq / 2.0)
+
+    return p_values
+
+
+def _batch_block_frequency_test(bits, lengths):
+    block_size = (lengths // 10) + 1
+    nb_blocks = lengths // block_size
+
+    # block_size > n / 10 leaves at most 10 blocks per sequence
+    cumsum = np.zeros((len(bits), bits.shape[1] + 1), dtype=np.int64)
+    np.cumsum(bits, axis=1, out=cumsum[:, 1:])
+    bounds = np.minimum(np.arange(11) * block_size[:, None], bits.shape[1])
+    block_sums = np.diff(np.take_along_axis(cumsum, bounds, axis=1), axis=1)
+
+    pi = block_sums / block_size[:, None]
+    chisq = 4 * block_size * np.sum(np.where(np.arange(10) < nb_blocks[:, None], (pi - 0.5) ** 2, 0), axis=1)
+    p_values = sp.special.gammaincc(nb_blocks / 2,
+                                    chisq / 2)
+
+    # for block_size == 1 degenerates to monobit test
+    return np.where(block_size == 1, _batch_monobit_test(bits, lengths), p_values)
+
+
+def _batch_cusum_test_statistics(bits, lengths):
+    # maximal absolute partial sums of the +-1 random walk over the bits and over the reversed bits
+    in_length = np.arange(bits.shape[1]) < lengths[:, None]
+    walk = np.cumsum(np.where(in_length, 2 * bits.astype(np.int32) - 1, 0), axis=1)
+    forward_z = np.max(np.abs(walk), axis=1, where=in_length, initial=0)
+
+    # the reversed walk after j steps is the total minus the forward walk after n - j steps
+    total = walk[:, -1:]
+    previous = np.concatenate([np.zeros((len(bits), 1), dtype=walk.dtype), walk[:, :-1]], axis=1)
+    backward_z = np.max(np.abs(total - previous), axis=1, where=in_length, initial=0)
+
+    return forward_z, backward_z
+
+
+def _batch_double_cusum_test(bits, lengths):
+    forward_z, backward_z = _batch_cusum_test_statistics(bits, lengths)
+
+    return _batch_cusum_test_pvalue(lengths, forward_z) + _batch_cusum_test_pvalue(lengths, backward_z)
+
+
+def _batch_longest_run_of_ones_test(bits, lengths):
+    p_values = np.empty(len(bits))
+    # index of the parameters of _longest_run_parameters
+    regimes = np.searchsorted([128, 6272, 750000], lengths, side='right')
+
+    for regime in np.unique(regimes):
+        rows = np.flatnonzero(regimes == regime)
+        K, M, V, pi = _longest_run_parameters([0, 128, 6272, 750000][regime])
+        blocks, in_length = _batch_blocks(bits[rows], lengths[rows], M)
+
+        run = np.zeros(blocks.shape[:2], dtype=np.int64)
+        max_run = np.zeros(blocks.shape[:2], dtype=np.int64)
+        for i in range(M):
+            run = (run + 1) * blocks[:, :, i]
+            np.maximum(max_run, run, out=max_run)
+
+        # frequency class of every run length, -1 for run lengths counted in no class
+        classes = np.full(M + 1, -1)
+        for max_run_length in range(M + 1):
+            if max_run_length <= V[0]:
+                classes[max_run_length] = 0
+            elif max_run_length > V[-1]:
+                classes[max_run_length] = K
+            elif max_run_length in V[1:K]:
+                classes[max_run_length] = V.index(max_run_length, 1)
+
+        block_classes = classes[max_run]
+        counted = in_length & (block_classes >= 0)
+        frequencies = np.bincount((np.arange(len(rows))[:, None] * (K + 1) + block_classes)[counted],
+                                  minlength=len(rows) * (K + 1)).reshape(len(rows), K + 1)
+
+        N = in_length.sum(axis=1)
+        chisq = 0
+        for i in range(K + 1):
+            chisq = chisq + ((frequencies[:, i] - N * pi[i]) ** 2) / (N * pi[i])
+        p_values[rows] = sp.special.gammaincc(K / 2,
+                                              chisq / 2)
+
+    return p_values
+
+
+def _batch_monobit_test(bits, lengths):
+    s = 2 * bits.sum(axis=1, dtype=np.int64) - lengths
+
+    s_abs = np.abs(s) / np.sqrt(lengths)
+    return sp.special.erfc(s_abs / 1.4142135623730951)
+
+
+def _batch_runs_test(bits, lengths):
+    pi = bits.sum(axis=1, dtype=np.int64) / lengths
+    tau = 2 / np.sqrt(lengths)
+
+    in_length = np.arange(1, bits.shape[1]) < lengths[:, None]
+    v = np.sum((bits[:, 1:] != bits[:, :-1]) & in_length, axis=1) + 1
+    pi_sq = pi * (1 - pi)
+    p_values = sp.special.erfc(np.abs(v - 2 * lengths * pi_sq) / (2 * np.sqrt(2 * lengths) * pi_sq))
+
+    # not applicable if failed Frequency (Monobit) test -> p_value = 0.00...
+    return np.where(np.abs(pi - 0.5) >= tau, 0, p_values)
+
+
+def _batch_spectral_test(bits, lengths):
+    p_values = np.empty(len(bits))
+
+    # one FFT over all sequences of the same length
+    for n in np.unique(lengths):
+        rows = np.flatnonzero(lengths == n)
+        S = sp.fft.fft(2 * bits[rows, :n].astype(np.int64) - 1, axis=1)
+
+        M = np.abs(S[:, :n // 2])
+        T = np.sqrt(2.995732273553991 * n)  # sqrt(log(1 / 0.05) * n)
+
+        N_0 = 0.95 * n / 2
+        N_1 = np.count_nonzero(M < T, axis=1)
+
+        d = (N_1 - N_0) / np.sqrt(n * 0.011875)                         # (n1 - n0) / sqrt(n * (0.95)(0.05) / 4)
+        p_values[rows] = sp.special.erfc(np.abs(d) / 1.4142135623730951)  # erfc(abs(d) / sqrt(2))
+
+    return p_values
+
+
+BATCH_TEST_MAPPING = {
+    'binary-matrix-rank':  _batch_binary_matrix_rank_test,
+    # rank over GF(2) as defined by NIST SP 800-22, not used by the RandomnessTests features
+    'binary-matrix-rank-gf2': functools.partial(_batch_binary_matrix_rank_test, gf2=True),
+    'block-frequency':     _batch_block_frequency_test,
+    'double-cusum':        _batch_double_cusum_test,
+    'longest-run-of-ones': _batch_longest_run_of_ones_test,
+    'monobit':             _batch_monobit_test,
+    'runs':                _batch_runs_test,
+    'spectral':            _batch_spectral_test
+}
+
+
+def pad_bit_arrays(bit_arrays):
+    """Packs bit sequences of different lengths into a zero padded matrix for :py:func:`randomness_test_pvalues`.
+
+    Parameters
+    ----------
+    bit_arrays : list of np.ndarray
+        1-D arrays of 0/1 values, e.g. evaluations of :py:data:`.JoinedSubdomainsBitArray`.
+
+    Returns
+    -------
+    bits : np.ndarray
+        (N, longest length) int8 matrix holding one sequence per row.
+    lengths : np.ndarray
+        Length of every sequence.
+    """
+    lengths = np.fromiter((bit_array.size for bit_array in bit_arrays), dtype=np.int64, count=len(bit_arrays))
+    bits = np.zeros((len(bit_arrays), lengths.max(initial=0)), dtype=np.int8)
+    bits[np.arange(bits.shape[1]) < lengths[:, None]] = np.concatenate([np.ravel(b) for b in bit_arrays] or [[]])
+    return bits, lengths
+
+
+def randomness_test_pvalues(bits, lengths, tests=tuple(TEST_MAPPING)):
+    """Evaluates randomness tests for a batch of bit sequences at once.
+
+    Parameters
+    ----------
+    bits : np.ndarray
+        (N, L) matrix of 0/1 values, row i holds a sequence of lengths[i] >= 1 bits followed by arbitrary padding.
+    lengths : np.ndarray
+        Length of every sequence.
+    tests : sequence of str
+        Identifiers of the tests as in :py:data:`TEST_MAPPING`.
+
+    Returns
+    -------
+    np.ndarray
+        (N, len(tests)) matrix with one column of p-values per test, equal to the values of the per-sample tests.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    bits = np.where(np.arange(np.shape(bits)[1]) < lengths[:, None], bits, 0).astype(np.int8)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([BATCH_TEST_MAPPING[test](bits, lengths) for test in tests], axis=1)
+
+
+def evaluate_randomness_tests(samples, bitarray=JoinedSubdomainsBitArray, tests=tuple(TEST_MAPPING)):
+    """Evaluates randomness tests for a batch of samples, see :py:func:`randomness_test_pvalues`.
+
+    Parameters
+    ----------
+    samples : list of str
+        Domains to evaluate.
+    bitarray : Feature
+        Bit sequence the tests are applied to, :py:data:`.JoinedSubdomainsBitArray` or
+        :py:data:`.JoinedSubdomainsUnicodeBitarray`.
+    tests : sequence of str
+        Identifiers of the tests as in :py:data:`TEST_MAPPING`.
+
+    Returns
+    -------
+    np.ndarray
+        (N, len(tests)) matrix with one column of p-values per test.
+    """
+    return randomness_test_pvalues(*pad_bit_arrays([bitarray.evaluate(sample) for sample in samples]), tests=tests)
+
+
 RandomnessTests = FeatureCollection([
     CachedCallableFeature(name=f'{prefix}-test{suffix}',
                           return_type=FeatureReturnType.INTEGER,
@@ -464,7 +905,7 @@ runs-test-unicode False
 
 def _zlib_bit_compression_ratio(sample):
     bits = JoinedSubdomainsBitArray.evaluate(sample)
-    bit_string = ''.join(map(str, bits)).encode()
+    bit_string = (np.asarray(bits, dtype=np.uint8) + ord('0')).tobytes()
 
     compressed_data = zlib.compress(bit_string, 9)
 
@@ -519,3 +960,109 @@ Examples
 5.781359713524662
 
 """
+
+
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+
+def pack_bit_arrays(bit_arrays):
+    """Packs bit sequences of different lengths into a byte matrix for :py:func:`zlib_bits_compression_ratios` and
+    :py:func:`bits_entropies`.
+
+    Parameters
+    ----------
+    bit_arrays : list of np.ndarray
+        1-D arrays of 0/1 values, e.g. evaluations of :py:data:`.JoinedSubdomainsBitArray`.
+
+    Returns
+    -------
+    packed : np.ndarray
+        (N, ceil(longest length / 8)) uint8 matrix holding the bits of one sequence per row, zero padded.
+    lengths : np.ndarray
+        Length of every sequence in bits.
+    """
+    bits, lengths = pad_bit_arrays(bit_arrays)
+    return np.packbits(bits, axis=1), lengths
+
+
+def _zlib_compressed_sizes(ascii_bits, lengths, rows):
+    return [len(zlib.compress(ascii_bits[row, :lengths[row]], 9)) for row in rows]
+
+
+def zlib_bits_compression_ratios(packed, lengths, n_jobs=1, chunk_size=1024):
+    """Evaluates :py:data:`ZlibBitsCompressionRatio` for a batch of packed bit sequences.
+
+    Parameters
+    ----------
+    packed : np.ndarray
+        (N, B) uint8 matrix of packed bits, see :py:func:`pack_bit_arrays`.
+    lengths : np.ndarray
+        Length of every sequence in bits.
+    n_jobs : int
+        Number of threads compressing chunks of chunk_size sequences, zlib releases the GIL while compressing.
+    chunk_size : int
+        Number of sequences per task of the thread pool.
+
+    Returns
+    -------
+    np.ndarray
+        Compression ratio of every sequence.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    # '0'/'1' characters of all bits at once, every row is compressed from a view without copying it
+    ascii_bits = np.unpackbits(packed, axis=1)
+    ascii_bits += ord('0')
+
+    chunks = [range(start, min(start + chunk_size, len(lengths))) for start in range(0, len(lengths), chunk_size)]
+    compress = functools.partial(_zlib_compressed_sizes, ascii_bits, lengths)
+    if n_jobs == 1:
+        sizes = [compress(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(n_jobs) as executor:
+            sizes = list(executor.map(compress, chunks))
+
+    return lengths / np.array([size for chunk in sizes for size in chunk], dtype=np.float64)
+
+
+def bits_entropies(packed, lengths):
+    """Evaluates :py:data:`BitsEntropy` for a batch of packed bit sequences.
+
+    The bit sequence taken as distribution assigns 1 / k to each of its k ones, so its entropy is log2(k).
+
+    Parameters
+    ----------
+    packed : np.ndarray
+        (N, B) uint8 matrix of packed and zero padded bits, see :py:func:`pack_bit_arrays`.
+    lengths : np.ndarray
+        Length of every sequence in bits.
+
+    Returns
+    -------
+    np.ndarray
+        Entropy of every sequence. As for :py:data:`BitsEntropy`, empty sequences (domains without subdomains) have
+        entropy 0 and non-empty sequences without ones nan.
+    """
+    ones = _POPCOUNT[packed].sum(axis=1)
+    with np.errstate(divide='ignore'):
+        entropies = np.where(ones > 0, np.log2(ones), np.nan)
+    entropies[np.asarray(lengths) == 0] = 0.
+    return entropies
+
+
+def evaluate_bits_features(samples, n_jobs=1):
+    """Evaluates :py:data:`ZlibBitsCompressionRatio` and :py:data:`BitsEntropy` for a batch of samples.
+
+    Parameters
+    ----------
+    samples : list of str
+        Domains to evaluate.
+    n_jobs : int
+        Number of compression threads, see :py:func:`zlib_bits_compression_ratios`.
+
+    Returns
+    -------
+    np.ndarray
+        (N, 2) matrix with the compression ratios and the entropies.
+    """
+    packed, lengths = pack_bit_arrays([JoinedSubdomainsBitArray.evaluate(sample) for sample in samples])
+    return np.stack([zlib_bits_compression_ratios(packed, lengths, n_jobs), bits_entropies(packed, lengths)], axis=1)
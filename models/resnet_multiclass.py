@@ -1,6 +1,6 @@
 import settings
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Activation, add, Conv1D, Dense, Embedding, Flatten, Input, MaxPooling1D
+from tensorflow.keras.layers import Activation, add, Conv1D, Dense, Embedding, Flatten, Input, MaxPooling1D, Reshape
 
 MODEL_NAME = "M-ResNet"
 
@@ -20,8 +20,13 @@ def residual(inp, filters, kernels):
     return out
 
 
-def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_classes=settings.nb_classes):
-    inp = Input(shape=(maxlen,))
+def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_classes=settings.nb_classes,
+                variable_length=False):
+    """
+    With variable_length, the model accepts domains padded to any width up to 256 instead of exactly maxlen, e.g. the
+    length buckets of util.bucket_widths. The eight poolings reduce every such width to a single position.
+    """
+    inp = Input(shape=(None if variable_length else maxlen,))
     out = Embedding(input_dim=max_features, output_dim=128, input_length=maxlen, name='Input')(inp)
 
     out = residual(out, 128, [4, 4])
@@ -54,7 +59,11 @@ def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_c
     out = Activation("relu")(out)
     out = residual(out, 256, [2, 2])
 
-    out = Flatten()(out)
+    if variable_length:
+        # A single position is left, its static length is unknown though.
+        out = Reshape((256,))(out)
+    else:
+        out = Flatten()(out)
     out = Dense(nb_classes)(out)
     out = Activation('softmax')(out)
 
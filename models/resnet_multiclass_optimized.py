@@ -21,9 +21,17 @@ def residual(inp, filters, kernels):
 
 
 def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_classes=settings.nb_classes,
-                tldlen=len(settings.tlds)):
+                tldlen=len(settings.tlds), sparse_tld=False):
+    """
+    With sparse_tld, the TLD is passed as a single int id (see util.preprocess_data_tld) instead of a one-hot vector.
+    Its contribution to the output layer is then looked up from an embedding, which is equivalent to the
+    TLD part of the output layer's kernel in the one-hot variant (see to_sparse).
+    """
     inp = Input(shape=(maxlen,))
-    tld = Input(shape=(tldlen,))
+    if sparse_tld:
+        tld = Input(shape=(1,), dtype='int32')
+    else:
+        tld = Input(shape=(tldlen,))
     out = Embedding(input_dim=max_features, output_dim=128, input_length=maxlen, name='Input')(inp)
 
     out = residual(out, 128, [4, 4])
@@ -48,11 +56,40 @@ def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_c
     out = Activation("relu")(out)
 
     out = Flatten()(out)
-    out = concatenate([out, tld])
-    out = Dense(nb_classes)(out)
+    if sparse_tld:
+        out = Dense(nb_classes)(out)
+        out = add([out, Flatten()(Embedding(input_dim=tldlen, output_dim=nb_classes, name='TLD')(tld))])
+    else:
+        out = concatenate([out, tld])
+        out = Dense(nb_classes)(out)
     out = Activation('softmax')(out)
 
     model = Model([inp, tld], out)
     model.compile(loss='categorical_crossentropy', optimizer='adam')
 
     return model, MODEL_NAME
+
+
+def to_sparse(model):
+    """
+    Converts a trained one-hot TLD model into an equivalent model with sparse_tld=True.
+    The output layer's kernel rows belonging to the one-hot TLD input become the TLD embedding.
+    """
+    maxlen, tldlen = model.inputs[0].shape[1], model.inputs[1].shape[1]
+    nb_classes = model.outputs[0].shape[-1]
+    max_features = model.get_layer('Input').input_dim
+
+    sparse_model, _ = build_model(max_features=max_features, maxlen=maxlen, nb_classes=nb_classes, tldlen=tldlen,
+                                  sparse_tld=True)
+
+    dense_layers = [layer for layer in model.layers if layer.weights]
+    sparse_layers = [layer for layer in sparse_model.layers if layer.weights and layer.name != 'TLD']
+
+    for dense_layer, sparse_layer in zip(dense_layers[:-1], sparse_layers[:-1]):
+        sparse_layer.set_weights(dense_layer.get_weights())
+
+    kernel, bias = dense_layers[-1].get_weights()
+    sparse_layers[-1].set_weights([kernel[:-tldlen], bias])
+    sparse_model.get_layer('TLD').set_weights([kernel[-tldlen:]])
+
+    return sparse_model
@@ -0,0 +1,52 @@
+import settings
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Activation, add, Conv1D, Dense, Embedding, GlobalMaxPooling1D, Input, \
+    MaxPooling1D, SeparableConv1D
+
+MODEL_NAME = "M-ResNet_student"
+
+
+def residual(inp, filters, kernels):
+    res = inp
+    if inp.shape[2] != filters:
+        res = Conv1D(filters=filters, kernel_size=1, strides=1, padding="same", trainable=True)(inp)
+
+    out = SeparableConv1D(filters=filters, kernel_size=kernels[0], strides=1, padding="same")(inp)
+    out = Activation("relu")(out)
+    out = SeparableConv1D(filters=filters, kernel_size=kernels[1], strides=1, padding="same")(out)
+    out = add([res, out])
+
+    return out
+
+
+def build_model(max_features=settings.max_features, maxlen=settings.maxlen, nb_classes=settings.nb_classes,
+                variable_length=False):
+    """
+    Compact student of the M-ResNet for knowledge distillation (see demonstration_distillation.py):
+    four residual stages of depthwise separable convolutions with 64/128 filters, pooling by 4 and a global max
+    pooling, about 30x fewer multiply-adds than the M-ResNet. The global pooling accepts any input width, e.g. the
+    length buckets of util.bucket_widths with variable_length.
+    """
+    inp = Input(shape=(None if variable_length else maxlen,))
+    out = Embedding(input_dim=max_features, output_dim=32, name='Input')(inp)
+
+    out = residual(out, 64, [4, 4])
+    out = Activation("relu")(out)
+    out = MaxPooling1D(pool_size=4, padding='same')(out)
+    out = residual(out, 64, [3, 3])
+    out = Activation("relu")(out)
+    out = MaxPooling1D(pool_size=4, padding='same')(out)
+    out = residual(out, 128, [2, 2])
+    out = Activation("relu")(out)
+    out = MaxPooling1D(pool_size=4, padding='same')(out)
+    out = residual(out, 128, [2, 2])
+    out = Activation("relu")(out)
+
+    out = GlobalMaxPooling1D()(out)
+    out = Dense(nb_classes)(out)
+    out = Activation('softmax')(out)
+
+    model = Model(inp, out)
+    model.compile(loss='categorical_crossentropy', optimizer='adam')
+
+    return model, MODEL_NAME
@@ -0,0 +1,151 @@
+import numpy as np
+import tensorflow as tf
+
+import util
+import settings
+
+
+def build(load_batch, output_signature, indices, batch_size=256, shuffle=True, shuffle_buffer=2 ** 16,
+          num_parallel_calls=tf.data.AUTOTUNE, keys=None):
+    """
+    Generic tf.data input pipeline: shuffles the row indices, batches them and loads every batch with
+    load_batch in parallel map calls. Batches are prefetched so that loading overlaps with training steps.
+    Only the shuffle buffer of indices and the prefetched batches are held in memory.
+
+    Args:
+        load_batch: Function mapping an int64 array of row indices to (inputs, labels) numpy arrays.
+        output_signature: Nested tf.TensorSpec structure matching the return value of load_batch.
+        indices: Row indices to iterate over.
+        batch_size: Number of rows per batch.
+        shuffle: Whether to reshuffle the indices on every epoch.
+        shuffle_buffer: Size of the shuffle buffer.
+        num_parallel_calls: Number of batches loaded in parallel.
+        keys: Optional int key per index, every batch then only holds indices with the same key (e.g. length bucket).
+
+    Returns:
+        A tf.data.Dataset that can directly be passed to model.fit / model.predict.
+    """
+    flat_signature = tf.nest.flatten(output_signature)
+
+    def load(idx):
+        flat = tf.numpy_function(lambda i: tf.nest.flatten(load_batch(i)), [idx],
+                                 [spec.dtype for spec in flat_signature])
+        for tensor, spec in zip(flat, flat_signature):
+            tensor.set_shape(spec.shape)
+        return tf.nest.pack_sequence_as(output_signature, flat)
+
+    if keys is None:
+        ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+    else:
+        ds = tf.data.Dataset.from_tensor_slices((np.asarray(indices, dtype=np.int64),
+                                                 np.asarray(keys, dtype=np.int64)))
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        ds = ds.group_by_window(key_func=lambda idx, key: key,
+                                reduce_func=lambda key, window: window.batch(batch_size),
+                                window_size=batch_size)
+        ds = ds.map(lambda idx, key: idx)
+    ds = ds.map(load, num_parallel_calls=num_parallel_calls, deterministic=not shuffle)
+
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def _labels(labels, binary, nb_classes):
+    labels = np.asarray(labels)
+    if binary:
+        return (labels != 0).astype(np.float32)
+    if nb_classes is not None:
+        return np.eye(nb_classes, dtype=np.float32)[labels]
+    return labels.astype(np.int64)
+
+
+def _label_spec(binary, nb_classes):
+    if binary:
+        return tf.TensorSpec((None,), tf.float32)
+    if nb_classes is not None:
+        return tf.TensorSpec((None, nb_classes), tf.float32)
+    return tf.TensorSpec((None,), tf.int64)
+
+
+def from_encoded(x, labels, indices, binary=False, nb_classes=None, lengths=None, buckets=settings.length_buckets,
+                 **kwargs):
+    """
+    Pipeline over the memory-mapped index matrix of dataset.load_encoded, feeding M-ResNet and B-ResNet.
+    Invalid rows have to be removed from indices beforehand, e.g. indices[valid[indices]].
+    Labels are reduced to benign/malicious if binary is set and one-hot encoded if nb_classes is given.
+    If the domain lengths are given, batches are grouped by length bucket (see util.bucket_widths) and only padded
+    to the bucket width, for models accepting variable-length input. The rows are left-padded, so the last
+    width columns hold a domain padded to width.
+    """
+    widths = None if lengths is None else util.bucket_widths(lengths, buckets)
+
+    def load_batch(idx):
+        # Sorted rows give sequential reads from the memory map, the batch itself is already shuffled.
+        idx = np.sort(idx)
+        batch = np.asarray(x[idx])
+        if widths is not None:
+            batch = np.ascontiguousarray(batch[:, -widths[idx[0]]:])
+        return batch, _labels(labels[idx], binary, nb_classes)
+
+    width = x.shape[1] if widths is None else None
+    output_signature = (tf.TensorSpec((None, width), tf.as_dtype(x.dtype)), _label_spec(binary, nb_classes))
+
+    return build(load_batch, output_signature, indices, keys=None if widths is None else widths[indices], **kwargs)
+
+
+def from_soft_targets(x, labels, indices, soft_targets, nb_classes=settings.nb_classes, lengths=None,
+                      buckets=settings.length_buckets, **kwargs):
+    """
+    Pipeline like from_encoded producing (domains, (one-hot labels, soft targets)) batches for knowledge distillation.
+    soft_targets holds one row per index in np.sort(indices), e.g. the teacher probabilities of distillation.py.
+    """
+    rows = np.sort(indices)
+    widths = None if lengths is None else util.bucket_widths(lengths, buckets)
+
+    def load_batch(idx):
+        idx = np.sort(idx)
+        batch = np.asarray(x[idx])
+        if widths is not None:
+            batch = np.ascontiguousarray(batch[:, -widths[idx[0]]:])
+        soft = np.asarray(soft_targets[np.searchsorted(rows, idx)], dtype=np.float32)
+        return batch, (_labels(labels[idx], False, nb_classes), soft)
+
+    width = x.shape[1] if widths is None else None
+    output_signature = (tf.TensorSpec((None, width), tf.as_dtype(x.dtype)),
+                        (_label_spec(False, nb_classes), tf.TensorSpec((None, nb_classes), tf.float32)))
+
+    return build(load_batch, output_signature, indices, keys=None if widths is None else widths[indices], **kwargs)
+
+
+def from_tld(data, indices, nb_classes=None, sparse_tld=False, **kwargs):
+    """
+    Pipeline over a dataset.DomainDataset producing the ([domains, tld], labels) batches of the optimized M-ResNet.
+    The TLD is a one-hot vector or, with sparse_tld, a single int id per domain.
+    Domains with invalid characters are dropped from their batch.
+    """
+    def load_batch(idx):
+        idx = np.sort(idx)
+        domains = data.domains(idx)
+        _, valid = util.encode_domains(domains, maxlen=0)
+        domains = [d for (d, v) in zip(domains, valid) if v]
+
+        if sparse_tld:
+            (x, tld), _, _ = util.preprocess_data_tld(domains, None)
+            tld = tld.reshape(-1, 1)
+        else:
+            domains, _, _ = util.preprocess_data_ohe_tld(domains, None)
+            x = np.array([d for (d, _) in domains], dtype=np.int32).reshape(-1, settings.maxlen)
+            tld = np.array([t for (_, t) in domains], dtype=np.float32).reshape(-1, len(settings.tlds))
+
+        return (x, tld), _labels(data.labels[idx][valid], False, nb_classes)
+
+    if sparse_tld:
+        tld_spec = tf.TensorSpec((None, 1), tf.int32)
+    else:
+        tld_spec = tf.TensorSpec((None, len(settings.tlds)), tf.float32)
+    output_signature = ((tf.TensorSpec((None, settings.maxlen), tf.int32), tld_spec), _label_spec(False, nb_classes))
+
+    return build(load_batch, output_signature, indices, **kwargs)
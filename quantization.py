@@ -0,0 +1,171 @@
+import time
+import numpy as np
+
+import util
+import settings
+
+
+def calibration_indices(labels, nb_samples=1024, random_state=None):
+    """
+    Draws about nb_samples row indices spread evenly over the classes, so that rare families are part of the
+    calibration (or evaluation) data. Classes with fewer rows contribute all of them, rows with a negative label
+    are skipped.
+    """
+    rng = np.random.default_rng(random_state)
+    labels = np.asarray(labels)
+    classes = np.unique(labels[labels >= 0])
+    per_class = max(1, nb_samples // len(classes))
+
+    indices = [rng.permutation(np.flatnonzero(labels == c))[:per_class] for c in classes]
+    return np.sort(np.concatenate(indices))
+
+
+def encoded_samples(data, indices):
+    """
+    Encoded domains, labels and domain lengths (see util.predict_bucketed) of the rows indices of a
+    dataset.DomainDataset, invalid domains are dropped.
+    """
+    domains = data.domains(indices)
+    x, valid = util.encode_domains(domains)
+    lengths = np.array([len(d) for d in domains])[valid]
+    return x, np.asarray(data.labels[indices])[valid], lengths
+
+
+def quantize_keras(model, calibration, int8=True, lengths=None, buckets=None):
+    """
+    Converts a Keras M-ResNet or B-ResNet to TFLite. With int8, weights and activations are quantized to int8
+    (post-training, calibrated on the encoded domains calibration). Inputs and outputs stay float32, ops
+    without int8 kernel fall back to float.
+    A variable-length M-ResNet is calibrated on every domain at the width of its length bucket, given the domain
+    lengths and the buckets of the artifact, so that the activation ranges match those seen by serve.Scorer.
+
+    Returns: The TFLite flatbuffer as bytes.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        calibration = np.asarray(calibration, dtype=np.float32)
+        widths = np.full(len(calibration), calibration.shape[1]) if buckets is None \
+            else util.bucket_widths(lengths, buckets)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([calibration[i:i + 1, -widths[i]:]]
+                                                    for i in range(len(calibration)))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    return converter.convert()
+
+
+class TFLiteModel:
+
+    def __init__(self, content, batch_size=256, num_threads=None):
+        """
+        Runs a TFLite model on batches of encoded domains. The interpreter is allocated once for batch_size rows
+        and the width of the domains, smaller batches are padded. A variable-length model is reallocated whenever
+        the width changes, see bucketed.
+        """
+        import tensorflow as tf
+
+        self.batch_size = batch_size
+        self.interpreter = tf.lite.Interpreter(model_content=content, num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]['index']
+        self.output = self.interpreter.get_output_details()[0]['index']
+        self.width = None
+        self._allocate(settings.maxlen)
+
+    def _allocate(self, width):
+        if width != self.width:
+            self.interpreter.resize_tensor_input(self.input, [self.batch_size, width])
+            self.interpreter.allocate_tensors()
+            self.width = width
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        self._allocate(x.shape[1])
+        out = []
+        for start in range(0, len(x), self.batch_size):
+            batch = x[start:start + self.batch_size]
+            padded = np.zeros((self.batch_size, x.shape[1]), dtype=np.float32)
+            padded[:len(batch)] = batch
+            self.interpreter.set_tensor(self.input, padded)
+            self.interpreter.invoke()
+            out.append(self.interpreter.get_tensor(self.output)[:len(batch)])
+        return np.concatenate(out)
+
+
+def batched(predict, batch_size=256):
+    """
+    Wraps predict so that it is called on at most batch_size encoded domains at once.
+    """
+    def predict_batches(x):
+        return np.concatenate([predict(x[start:start + batch_size]) for start in range(0, len(x), batch_size)])
+
+    return predict_batches
+
+
+def bucketed(predict, lengths, buckets):
+    """
+    Wraps predict of a variable-length model so that, like serve.Scorer, every length bucket is predicted at its
+    width (see util.predict_bucketed). The wrapped function takes the encoded domains of the lengths.
+    """
+    def predict_buckets(x):
+        return util.predict_bucketed(predict, x, lengths, buckets)
+
+    return predict_buckets
+
+
+def torch_predict(model, batch_size=256):
+    """
+    Predict function of a torch model on encoded domains, see quantize_keras / TFLiteModel for the Keras models.
+    """
+    import torch
+
+    def predict(x):
+        with torch.no_grad():
+            return model(torch.as_tensor(x).long()).numpy()
+
+    return batched(predict, batch_size)
+
+
+def class_accuracy(predict, x, y, binary=False):
+    """
+    Accuracy of predict per class in y and the throughput in domains/s.
+    For binary models a domain counts as correct if it is detected as benign (class 0) or malicious (all others).
+
+    Returns: Dict class id -> accuracy, domains/s.
+    """
+    start = time.perf_counter()
+    out = predict(x)
+    throughput = len(x) / (time.perf_counter() - start)
+
+    if binary:
+        correct = (out.reshape(-1) > 0.5) == (y != 0)
+    else:
+        correct = out.argmax(axis=1) == y
+    return {int(c): float(correct[y == c].mean()) for c in np.unique(y)}, throughput
+
+
+def report(variants, x, y, binary=False, max_drop=0.02):
+    """
+    Prints the per-class accuracy and throughput of several predict functions of the same model,
+    e.g. float32 and int8. Classes whose accuracy drops by more than max_drop w.r.t. the first variant are flagged.
+    Args:
+        variants: List of (name, predict) pairs, the first one is the reference.
+        x, y: Encoded domains and labels to evaluate on.
+        binary: Whether the model is the binary B-ResNet.
+        max_drop: Tolerated accuracy drop per class.
+
+    Returns: Dict name -> (per-class accuracies, domains/s).
+    """
+    results = {name: class_accuracy(predict, x, y, binary) for (name, predict) in variants}
+    names = [name for (name, _) in variants]
+    reference = results[names[0]][0]
+
+    print(f"{'class':<16s} {'n':>6s} " + " ".join(f"{name:>14s}" for name in names))
+    for c in sorted(reference):
+        accuracies = [results[name][0][c] for name in names]
+        flag = " <-" if min(accuracies) < reference[c] - max_drop else ""
+        print(f"{settings.group_map.get(c, c):<16s} {int((y == c).sum()):>6d} "
+              + " ".join(f"{a:>14.3f}" for a in accuracies) + flag)
+    print(f"{'domains/s':<23s} " + " ".join(f"{results[name][1]:>14.0f}" for name in names))
+
+    return results
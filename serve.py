@@ -0,0 +1,339 @@
+import json
+import time
+import queue
+import argparse
+import threading
+import collections
+import socketserver
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import util
+import cache
+import settings
+import artifacts
+
+BINARY_GROUP_MAP = {0: 'benign', 1: 'malicious'}
+
+
+class Scorer:
+
+    def __init__(self, artifact):
+        """
+        Scores batches of domains with a model artifact (see artifacts.load and artifacts.from_model).
+        Domains are scored in their normalized form (see cache.normalize), so that the result does not depend on
+        whether a CachedScorer sits in front. Domains with invalid characters are reported with class -1 and
+        confidence 0.
+        """
+        self.artifact = artifact
+        self.family = artifact.family
+        self.group_map = BINARY_GROUP_MAP if self.family == 'b-resnet' else settings.group_map
+
+    def _probabilities(self, domains):
+        if self.family == 'm-resnet_optimized':
+            if self.artifact.sparse_tld:
+                (x, tld), _, _ = util.preprocess_data_tld(domains, None)
+                x = [x, tld.reshape(-1, 1)]
+            else:
+                pairs, _, _ = util.preprocess_data_ohe_tld(domains, None)
+                x = [np.stack([d for (d, _) in pairs]), np.stack([t for (_, t) in pairs])]
+            return self.artifact.predict(x)
+
+        x, _ = util.encode_domains(domains)
+        if self.artifact.length_buckets:
+            out = util.predict_bucketed(self.artifact.predict, x, [len(d) for d in domains],
+                                        self.artifact.length_buckets)
+        else:
+            out = self.artifact.predict(x)
+
+        if self.family == 'b-cos':
+            out = np.exp(out - out.max(axis=1, keepdims=True))
+            return out / out.sum(axis=1, keepdims=True)
+        if self.family == 'b-resnet':
+            return np.concatenate([1 - out, out], axis=1)
+        return out
+
+    def score(self, domains):
+        """
+        Returns the class id and confidence of every domain.
+        """
+        domains = [cache.normalize(d) for d in domains]
+        classes = np.full(len(domains), -1, dtype=np.int64)
+        confidences = np.zeros(len(domains), dtype=np.float32)
+
+        _, valid = util.encode_domains(domains, maxlen=0)
+        if valid.any():
+            probs = self._probabilities([d for (d, v) in zip(domains, valid) if v])
+            classes[valid] = probs.argmax(axis=1)
+            confidences[valid] = probs.max(axis=1)
+
+        return classes, confidences
+
+    def stats(self):
+        return {}
+
+
+class ProbaScorer:
+
+    def __init__(self, model, group_map=settings.group_map):
+        """
+        Scores batches of domains with any model providing predict_proba(domains), e.g. an EXPLAIN model.
+        The columns of predict_proba are the model's classes_ if it has them, the class ids otherwise.
+        Domains are normalized like in Scorer.
+        """
+        self.model = model
+        self.group_map = group_map
+        self.classes = np.asarray(getattr(model, 'classes_', np.arange(len(group_map))), dtype=np.int64)
+
+    def score(self, domains):
+        """
+        Returns the class id and confidence of every domain like Scorer.score.
+        """
+        probs = np.asarray(self.model.predict_proba([cache.normalize(d) for d in domains]))
+        return self.classes[probs.argmax(axis=1)], probs.max(axis=1).astype(np.float32)
+
+    def stats(self):
+        return {}
+
+
+class CascadeScorer:
+
+    def __init__(self, gate, scorer, threshold=0.5):
+        """
+        Two-stage scoring: the binary gate (a Scorer of a B-ResNet artifact) screens all domains, only domains whose
+        malicious probability reaches threshold are attributed by scorer (a multiclass Scorer). The others are
+        reported as benign with the gate's confidence. Lower thresholds forward more domains and lose less recall.
+        """
+        assert gate.family == 'b-resnet', "the gate has to be a B-ResNet"
+        self.gate = gate
+        self.scorer = scorer
+        self.threshold = threshold
+        self.group_map = scorer.group_map
+        self.nb_domains = 0
+        self.nb_forwarded = 0
+
+    def score(self, domains):
+        """
+        Returns the class id and confidence of every domain like Scorer.score.
+        """
+        gate_classes, gate_confidences = self.gate.score(domains)
+        valid = gate_classes >= 0
+        malicious = np.where(gate_classes == 1, gate_confidences, 1 - gate_confidences)
+
+        classes = np.where(valid, 0, -1)
+        confidences = np.where(valid, 1 - malicious, 0).astype(np.float32)
+
+        forward = np.flatnonzero(valid & (malicious >= self.threshold))
+        if len(forward):
+            classes[forward], confidences[forward] = self.scorer.score([domains[i] for i in forward])
+
+        self.nb_domains += len(domains)
+        self.nb_forwarded += len(forward)
+        return classes, confidences
+
+    def stats(self):
+        return {'forwarded_share': self.nb_forwarded / self.nb_domains if self.nb_domains else 0.}
+
+
+class MicroBatcher:
+
+    def __init__(self, scorer, max_batch_size=256, max_latency=0.005, stats_window=10000):
+        """
+        Collects domains of concurrent requests into micro-batches that are scored together.
+        A batch is scored as soon as it holds max_batch_size domains or the oldest domain waited max_latency seconds.
+        """
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+
+        self.latencies = collections.deque(maxlen=stats_window)
+        self.nb_domains = 0
+        self.nb_batches = 0
+        self.busy_time = 0.
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, domains):
+        """
+        Enqueues the domains of one request and returns a Future resolving to one result dict per domain.
+        """
+        future = Future()
+        self.requests.put((list(domains), future, time.perf_counter()))
+        return future
+
+    def score(self, domains):
+        return self.submit(domains).result()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = batch[0][2] + self.max_latency
+
+        while size < self.max_batch_size:
+            # Requests already waiting are always taken, new ones only until the deadline of the oldest request.
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    request = self.requests.get(timeout=timeout)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            domains = [d for (request_domains, _, _) in batch for d in request_domains]
+
+            start = time.perf_counter()
+            try:
+                classes, confidences = self.scorer.score(domains)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end = time.perf_counter()
+
+            self.nb_batches += 1
+            self.nb_domains += len(domains)
+            self.busy_time += end - start
+
+            offset = 0
+            for request_domains, future, enqueued in batch:
+                results = []
+                for i, domain in enumerate(request_domains, offset):
+                    cls = int(classes[i])
+                    results.append({'domain': domain,
+                                    'class': cls,
+                                    'family': self.scorer.group_map.get(cls),
+                                    'confidence': float(confidences[i])})
+                offset += len(request_domains)
+
+                self.latencies.append(end - enqueued)
+                future.set_result(results)
+
+    def stats(self):
+        latencies = np.array(self.latencies)
+        return {
+            'domains': self.nb_domains,
+            'batches': self.nb_batches,
+            'domains_per_second_busy': self.nb_domains / self.busy_time if self.busy_time else 0.,
+            'latency_p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else 0.,
+            'latency_p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else 0.,
+            **self.scorer.stats(),
+        }
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """
+    POST /score with {"domains": [...]} returns one result per domain, GET /stats returns the batcher statistics.
+    """
+    batcher = None
+
+    def _reply(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self._reply({'error': 'not found'}, 404)
+        self._reply(self.batcher.stats())
+
+    def do_POST(self):
+        if self.path != '/score':
+            return self._reply({'error': 'not found'}, 404)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            domains = request['domains']
+        except (ValueError, KeyError, TypeError):
+            domains = None
+        if not isinstance(domains, list) or not all(isinstance(d, str) for d in domains):
+            return self._reply({'error': 'expected {"domains": [...]} with a list of strings'}, 400)
+
+        try:
+            results = self.batcher.score(domains)
+        except Exception as e:
+            return self._reply({'error': f'scoring failed: {e}'}, 500)
+        self._reply(results)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LineHandler(socketserver.StreamRequestHandler):
+    """
+    Line protocol for local sockets: one domain per line in, one "domain<TAB>class<TAB>family<TAB>confidence" line out.
+    """
+    batcher = None
+
+    def handle(self):
+        for line in self.rfile:
+            domain = line.decode('utf-8', errors='replace').strip()
+            if not domain:
+                continue
+            r = self.batcher.score([domain])[0]
+            self.wfile.write(f"{r['domain']}\t{r['class']}\t{r['family']}\t{r['confidence']:.6f}\n".encode())
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched online scoring of domains with a trained DGA classifier.")
+    parser.add_argument('--model', required=True, help="Directory of a model artifact written by artifacts.save.")
+    parser.add_argument('--gate', default=None, help="Directory of a B-ResNet artifact screening the domains first.")
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="Malicious probability of the gate from which domains are passed on to --model.")
+    parser.add_argument('--http', type=int, default=8080, help="HTTP port on localhost, 0 disables HTTP.")
+    parser.add_argument('--socket', default=None, help="Path of a Unix socket serving the line protocol.")
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-latency-ms', type=float, default=5.)
+    parser.add_argument('--cache-size', type=int, default=2 ** 16, help="Number of cached domains, 0 disables caching.")
+    parser.add_argument('--cache-ttl', type=float, default=None, help="Seconds after which cached results expire.")
+    parser.add_argument('--shared-cache', default=None,
+                        help="Name of a shared memory cache used by all serving processes given the same name.")
+    args = parser.parse_args()
+    if not args.http and not args.socket:
+        parser.error("at least one of --http and --socket is required")
+
+    scorer = Scorer(artifacts.load(args.model))
+    if args.gate:
+        scorer = CascadeScorer(Scorer(artifacts.load(args.gate)), scorer, args.threshold)
+    if args.shared_cache:
+        try:
+            scorer = cache.CachedScorer(scorer, cache.SharedScoreCache(args.shared_cache, args.cache_size,
+                                                                       ttl=args.cache_ttl))
+        except FileExistsError:
+            scorer = cache.CachedScorer(scorer, cache.SharedScoreCache(args.shared_cache, ttl=args.cache_ttl,
+                                                                       create=False))
+    elif args.cache_size:
+        scorer = cache.CachedScorer(scorer, cache.ScoreCache(args.cache_size, args.cache_ttl))
+
+    batcher = MicroBatcher(scorer,
+                           max_batch_size=args.max_batch_size,
+                           max_latency=args.max_latency_ms / 1000)
+    HTTPHandler.batcher = batcher
+    LineHandler.batcher = batcher
+
+    servers = []
+    if args.socket:
+        servers.append(ThreadingUnixServer(args.socket, LineHandler))
+    if args.http:
+        servers.append(ThreadingHTTPServer(('127.0.0.1', args.http), HTTPHandler))
+
+    for server in servers[:-1]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    servers[-1].serve_forever()
@@ -52,9 +52,16 @@ tlds = {'': 0, '3utilities.com': 1, 'ac': 2, 'ad': 3, 'ae': 4, 'af': 5, 'ag': 6,
         'ws': 240, 'wtf': 241, 'xxx': 242, 'xyz': 243, 'yt': 244, 'zapto.org': 245}
 
 DS_MODELS_PATH = "./datasets/mod.pkl"
+DS_MODELS_COLUMNAR_PATH = "./datasets/mod/"
+DS_ENCODED_CACHE_PATH = "./datasets/cache/"
 DS_EXPLAINABILITY_PATH = "./datasets/ex.pkl"
+ARTIFACTS_PATH = "./artifacts/"
 
 maxlen = 253
+# Seed of the k-fold split of the demonstrations, so that all models of a fold are trained on the same rows
+split_random_state = 42
+# Widths of the length buckets of the variable-length M-ResNet, see util.bucket_widths
+length_buckets = (16, 32, 64, 128, maxlen)
 max_features = len(valid_chars) + 1
 nb_classes = len(group_map)
 class_weighting_power = 0.2
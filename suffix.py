@@ -0,0 +1,107 @@
+import os
+import re
+import functools
+import importlib.util
+
+import idna
+import numpy as np
+
+import settings
+
+PUBLIC_SUFFIX_RE = re.compile(r'^(?P<suffix>[.*!]*\w[\S]*)', re.UNICODE | re.MULTILINE)
+PRIVATE_DOMAINS_SEPARATOR = "// ===BEGIN PRIVATE DOMAINS==="
+
+
+def bundled_psl_path():
+    """
+    Path of the public suffix list snapshot shipped with tldextract. Only the file is read, nothing is fetched.
+    """
+    return os.path.join(os.path.dirname(importlib.util.find_spec('tldextract').origin), '.tld_set_snapshot')
+
+
+def _decode_label(label):
+    try:
+        return idna.decode(label)
+    except (UnicodeError, IndexError):
+        return label
+
+
+class SuffixResolver:
+
+    def __init__(self, psl_path=None, tlds=settings.tlds, include_private=True):
+        """
+        Offline public suffix resolver built once from a public suffix list snapshot.
+        Rules are stored in a reverse-label trie and resolved like tldextract.extract(...).suffix
+        for host names, i.e. the longest matching rule wins and wildcard/exception rules are honoured.
+
+        Args:
+            psl_path: Path of the public suffix list, defaults to the snapshot bundled with tldextract.
+            tlds: Mapping from suffix to TLD id, see settings.tlds.
+            include_private: Whether to include the private domains section of the list.
+        """
+        with open(psl_path or bundled_psl_path(), encoding='utf-8') as f:
+            public, _, private = f.read().partition(PRIVATE_DOMAINS_SEPARATOR)
+
+        rules = [m.group('suffix') for m in PUBLIC_SUFFIX_RE.finditer(public)]
+        if include_private:
+            rules += [m.group('suffix') for m in PUBLIC_SUFFIX_RE.finditer(private)]
+
+        # Nested dicts keyed by label from right to left, the key None marks the end of a rule.
+        self.trie = {}
+        for rule in rules:
+            node = self.trie
+            for label in reversed(rule.split('.')):
+                node = node.setdefault(label, {})
+            node[None] = True
+
+        self.tlds = tlds
+
+    def suffix(self, domain):
+        if not domain.isascii():
+            domain = domain.replace("\u3002", ".").replace("\uff0e", ".").replace("\uff61", ".")
+        labels = domain.strip().rstrip('.').split('.')
+
+        node = self.trie
+        suffix_idx = label_idx = len(labels)
+        for label in reversed(labels):
+            label = label.lower()
+            if label.startswith("xn--"):
+                label = _decode_label(label)
+            if label in node:
+                label_idx -= 1
+                node = node[label]
+                if None in node:
+                    suffix_idx = label_idx
+                continue
+
+            if '*' in node:
+                suffix_idx = label_idx if '!' + label in node else label_idx - 1
+            break
+
+        return ".".join(labels[suffix_idx:])
+
+    def resolve(self, domains):
+        """
+        Batch counterpart of the TLD handling in util.preprocess_data_ohe_tld.
+
+        Returns:
+            The int32 TLD id of every domain (0 if its suffix is not in tlds) and the domains without their suffix.
+        """
+        tld_ids = np.zeros(len(domains), dtype=np.int32)
+        stripped = []
+
+        for i, domain in enumerate(domains):
+            tld = self.suffix(domain)
+
+            if tld in self.tlds:
+                tld_ids[i] = self.tlds[tld]
+                stripped.append("".join(domain.split("." + tld)[:-1]))
+            else:
+                stripped.append(domain)
+
+        return tld_ids, stripped
+
+
+@functools.lru_cache(maxsize=None)
+def default_resolver():
+    return SuffixResolver()
@@ -1,30 +1,116 @@
-import tldextract
 import numpy as np
 from tensorflow.keras.preprocessing import sequence
 
+import suffix
 import settings
 
+
+def _build_char_table(valid_chars=settings.valid_chars):
+    """
+    256-entry translation table from (latin-1) byte values to the indices in settings.valid_chars.
+    Bytes that do not belong to a valid character map to 0, which is never used by a valid character.
+    """
+    table = np.zeros(256, dtype=np.uint8)
+    for c, i in valid_chars.items():
+        table[ord(c)] = i
+    return table
+
+
+CHAR_TABLE = _build_char_table()
+
+
+def encode_bytes(buf, lengths, maxlen=settings.maxlen, dtype=np.int32, table=CHAR_TABLE):
+    """
+    Encodes domains given as one packed byte buffer and their lengths into a left-padded (N, maxlen) matrix.
+    Mirrors the layout of sequence.pad_sequences (pre-padding and pre-truncating).
+
+    Args:
+        buf: uint8 array holding the concatenated domains, one byte per character.
+        lengths: Number of bytes of each domain.
+        maxlen: Width of the resulting matrix.
+        dtype: Data type of the resulting matrix.
+        table: 256-entry translation table, see _build_char_table.
+
+    Returns:
+        The encoded domains containing only valid domains and a boolean mask over all domains
+        that marks the domains consisting solely of valid characters.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    codes = table[buf]
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    invalid = np.concatenate(([0], np.cumsum(codes == 0)))
+    valid = (invalid[ends] - invalid[starts]) == 0
+
+    # Target row and column of every character, keeping only the last maxlen characters of valid domains.
+    rows = np.repeat(np.cumsum(valid) - 1, lengths)
+    cols = np.arange(buf.size) - np.repeat(ends - maxlen, lengths)
+    keep = (cols >= 0) & np.repeat(valid, lengths)
+
+    domains = np.zeros((np.count_nonzero(valid), maxlen), dtype=dtype)
+    domains.reshape(-1)[rows[keep] * maxlen + cols[keep]] = codes[keep]
+
+    return domains, valid
+
+
+def encode_domains(X_data, maxlen=settings.maxlen, dtype=np.int32):
+    """
+    Encodes a batch of domains into a left-padded (N, maxlen) index matrix in bulk, see encode_bytes.
+    """
+    lengths = np.array(list(map(len, X_data)), dtype=np.int64)
+
+    # Characters outside of latin-1 are replaced by a single '?' so that each character is exactly one byte.
+    buf = np.frombuffer("".join(X_data).encode("latin-1", errors="replace"), dtype=np.uint8)
+
+    return encode_bytes(buf, lengths, maxlen=maxlen, dtype=dtype)
+
+
+def bucket_widths(lengths, buckets=settings.length_buckets):
+    """
+    Width of the length bucket of every domain: the smallest bucket width holding the domain.
+    Domains longer than the largest bucket are truncated to it like by encode_domains.
+    Since the width only depends on the length, a domain gets the same padding in training and inference.
+    """
+    buckets = np.asarray(buckets)
+    return buckets[np.minimum(np.searchsorted(buckets, lengths), len(buckets) - 1)]
+
+
+def predict_bucketed(predict, x, lengths, buckets=settings.length_buckets):
+    """
+    Runs predict on the left-padded (N, maxlen) domains x once per length bucket, with every bucket only padded to
+    its width, and returns the predictions in the order of x.
+    """
+    widths = bucket_widths(lengths, buckets)
+    out = None
+    for width in np.unique(widths):
+        rows = widths == width
+        pred = np.asarray(predict(np.ascontiguousarray(x[rows, -width:])))
+        if out is None:
+            out = np.zeros((len(x),) + pred.shape[1:], dtype=pred.dtype)
+        out[rows] = pred
+    return out
+
+
 def preprocess_data(X_data, y_data, binary):
+    domains, valid = encode_domains(X_data)
+    domainnames = [x for (x, v) in zip(X_data, valid) if v]
+
     if y_data is not None:
-        tuples = zip(X_data, y_data)
-        valid_tuples = [(x, y) for (x, y) in tuples if len([c for c in x if c not in settings.valid_chars]) == 0]
-        domainnames = [x[0] for x in valid_tuples]
+        valid_labels = [y for (y, v) in zip(y_data, valid) if v]
 
         if binary:
-            labels = [0 if x[1] == 0 else 1 for x in valid_tuples]
+            labels = [0 if y == 0 else 1 for y in valid_labels]
         else:
-            labels = [x[1] for x in valid_tuples]
+            labels = valid_labels
 
     else:
-        domainnames = [x for x in X_data if len([c for c in x if c not in settings.valid_chars]) == 0]
         labels = None
 
     if len(X_data) != len(domainnames):
         print(f"Ignoring {len(X_data) - len(domainnames)} domain(s) due to invalid characters")
 
-    domains = [[settings.valid_chars[y] for y in x] for x in domainnames]
-    domains = sequence.pad_sequences(domains, maxlen=settings.maxlen)
-
     return domains, labels, domainnames
 
 
@@ -32,20 +118,35 @@ def preprocess_data_ohe_tld(X_data, y_data, max_len_tlds=len(settings.tlds)):
     domainnames = X_data
     labels = y_data
 
-    domains = []
-    for domain in X_data:
-        tld = tldextract.extract(domain, include_psl_private_domains=True).suffix
+    tld_ids, stripped = suffix.default_resolver().resolve(X_data)
 
+    domains = []
+    for tld, tmp in zip(tld_ids, stripped):
         ohe = np.zeros(max_len_tlds)
-        if tld in settings.tlds:
-            ohe[settings.tlds[tld]] = 1
-            tmp = "".join(domain.split("." + tld)[:-1])
-        else:
-            ohe[0] = 1
-            tmp = domain
+        ohe[tld] = 1
 
         d = [settings.valid_chars[c] for c in tmp]
         d = sequence.pad_sequences([d], maxlen=settings.maxlen)[0]
         domains.append([d, ohe])
 
     return domains, labels, domainnames
+
+
+def preprocess_data_tld(X_data, y_data):
+    """
+    Sparse counterpart of preprocess_data_ohe_tld for the optimized M-ResNet with sparse_tld=True.
+    Returns the model input [domains, tld_ids] with the (N, maxlen) encoded domains without their TLD
+    and one int TLD id (index of settings.tlds) per domain instead of a one-hot vector.
+    Like preprocess_data, domains with invalid characters are ignored.
+    """
+    tld_ids, stripped = suffix.default_resolver().resolve(X_data)
+    domains, valid = encode_domains(stripped)
+    tlds = tld_ids[valid]
+
+    domainnames = [x for (x, v) in zip(X_data, valid) if v]
+    labels = [y for (y, v) in zip(y_data, valid) if v] if y_data is not None else None
+
+    if len(X_data) != len(domainnames):
+        print(f"Ignoring {len(X_data) - len(domainnames)} domain(s) due to invalid characters")
+
+    return [domains, tlds], labels, domainnames